@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from astrbot.api import logger
+from astrbot.api.event import MessageChain
+
+
+class TokenBucket:
+    """令牌桶限速器，每个平台一个，只由该平台的发送任务使用"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity  # 允许的突发条数
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RoomBroadcaster:
+    """房间广播
+
+    post() 只把消息记到对应会话的缓冲区；flush() 把每个会话缓冲的多条消息
+    合并成一条，放入该会话所属平台的有界发送队列。每个平台一个发送任务，
+    经令牌桶限速后通过 context.send_message 主动推送。
+    """
+
+    def __init__(self, context, rate: float = 2.0, burst: int = 5, queue_size: int = 1000):
+        self.context = context
+        self.rate = rate
+        self.burst = burst
+        self.queue_size = queue_size
+        self._pending = {}  # unified_msg_origin: [消息]
+        self._queues = {}  # 平台: asyncio.Queue
+        self._workers = {}  # 平台: 发送任务
+        self.sent_count = 0  # 已发送的消息条数（合并后）
+        self.dropped_count = 0  # 队列已满被丢弃的条数
+
+    @staticmethod
+    def platform_of(session: str) -> str:
+        """unified_msg_origin 形如 平台:消息类型:会话ID"""
+        return session.split(":", 1)[0]
+
+    def post(self, sessions, message: str):
+        """登记一条发往若干会话的消息"""
+        for session in sessions:
+            if session:
+                self._pending.setdefault(session, []).append(message)
+
+    def flush(self):
+        """合并缓冲区中的消息并放入发送队列"""
+        pending, self._pending = self._pending, {}
+        for session, messages in pending.items():
+            queue = self._queue_for(self.platform_of(session))
+            try:
+                queue.put_nowait((session, "\n\n".join(messages)))
+            except asyncio.QueueFull:
+                self.dropped_count += 1
+                logger.warning(f"发送队列已满，丢弃发往 {session} 的消息")
+
+    def _queue_for(self, platform: str) -> asyncio.Queue:
+        queue = self._queues.get(platform)
+        if queue is None:
+            queue = self._queues[platform] = asyncio.Queue(self.queue_size)
+            bucket = TokenBucket(self.rate, self.burst)
+            self._workers[platform] = asyncio.create_task(self._worker(queue, bucket))
+        return queue
+
+    async def _worker(self, queue: asyncio.Queue, bucket: TokenBucket):
+        while True:
+            session, text = await queue.get()
+            await bucket.acquire()
+            try:
+                await self.context.send_message(session, MessageChain().message(text))
+                self.sent_count += 1
+            except Exception as e:
+                logger.error(f"推送消息到 {session} 失败：{e}")
+
+    async def stop(self):
+        for task in self._workers.values():
+            task.cancel()
+        for task in self._workers.values():
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers.clear()
+        self._queues.clear()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import struct
+import time
+
+# 事件类型
+EVENT_START = 1  # 开局：词语和全员座位、身份
+EVENT_SPEECH = 2  # 发言
+EVENT_VOTE = 3  # 投票
+EVENT_ELIMINATE = 4  # 投票淘汰
+EVENT_LEAVE = 5  # 游戏中离开
+EVENT_END = 6  # 结束：胜方，中止时为空
+
+# 记录头：正文字节数、事件类型、时间戳、对局编号字节数；其后依次为对局编号和 JSON 正文
+RECORD_HEADER = struct.Struct("<IBdB")
+# 复用编码器，省去每次 json.dumps 构造编码器的开销
+_encode_payload = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def make_game_id(started: float, seed: int) -> str:
+    """对局编号：开局时间戳（8 位十六进制，据此直接定位开局当天的分段）+ 完整的 64 位房间种子
+
+    同一秒内开局的对局只靠种子区分，种子取全部 64 位才能保证编号不重复。
+    """
+    return f"{int(started):08x}{seed & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+def game_started(game_id: str) -> int:
+    """从对局编号中取出开局时间戳"""
+    return int(game_id[:8], 16)
+
+
+class GameLog:
+    """对局事件日志
+
+    每个事件编码为一条定长头 + 对局编号 + JSON 正文的记录，按自然日追加写入
+    目录下的分段文件（YYYYMMDD.log）。append() 只在内存缓冲区中拼接字节，
+    flush() 在线程中把缓冲区按分段批量写出，不阻塞事件循环。
+    读取时逐条读记录头，不属于目标对局的记录直接跳过正文，不需要整文件读入。
+    写出时崩溃可能在分段末尾留下残缺的记录，本进程第一次向某个分段追加前
+    先截掉残缺的尾部，否则之后追加的记录头都会错位。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._buffers = {}  # 日期: bytearray，尚未写出的记录
+        self._lock = asyncio.Lock()  # 串行化写出
+        self._day = None  # 当前分段的日期及其起止时间戳，跨天时才重新计算
+        self._day_range = (0.0, 0.0)
+        self._checked = set()  # 本进程已检查过尾部的分段日期
+        self.events_logged = 0
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._buffers)
+
+    def segment_path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{day}.log")
+
+    def append(self, game_id: str, event: int, payload: dict, now: float = None):
+        """登记一条事件（只写入内存缓冲区）"""
+        now = time.time() if now is None else now
+        gid = game_id.encode("utf-8")
+        body = _encode_payload(payload).encode("utf-8")
+        day = self._day_of(now)
+        buffer = self._buffers.get(day)
+        if buffer is None:
+            buffer = self._buffers[day] = bytearray()
+        buffer += RECORD_HEADER.pack(len(body), event, now, len(gid))
+        buffer += gid
+        buffer += body
+        self.events_logged += 1
+
+    def _day_of(self, now: float) -> str:
+        start, end = self._day_range
+        if not start <= now < end:
+            local = time.localtime(now)
+            start = time.mktime(local[:3] + (0, 0, 0, 0, 0, -1))
+            end = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+            self._day = time.strftime("%Y%m%d", local)
+            self._day_range = (start, end)
+        return self._day
+
+    async def flush(self):
+        if not self._buffers:
+            return
+        buffers, self._buffers = self._buffers, {}
+        async with self._lock:
+            await asyncio.to_thread(self._write, buffers)
+
+    def _write(self, buffers: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        for day, data in buffers.items():
+            path = self.segment_path(day)
+            if day not in self._checked:
+                self._truncate_torn_tail(path)
+                self._checked.add(day)
+            with open(path, "ab") as f:
+                f.write(data)
+
+    def _truncate_torn_tail(self, path: str):
+        """逐条跳过记录头找到最后一条完整记录的结尾，截掉其后写了一半的记录"""
+        if not os.path.exists(path):
+            return
+        size = os.path.getsize(path)
+        valid_end = 0
+        with open(path, "rb", buffering=1 << 16) as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                body_size, event, _, gid_size = RECORD_HEADER.unpack(header)
+                end = valid_end + RECORD_HEADER.size + gid_size + body_size
+                if end > size or not EVENT_START <= event <= EVENT_END:
+                    break
+                f.seek(end)
+                valid_end = end
+        if valid_end != size:
+            with open(path, "r+b") as f:
+                f.truncate(valid_end)
+
+    def read_game(self, game_id: str) -> list:
+        """读取一局的全部事件（阻塞 I/O），返回 (事件类型, 时间戳, 正文) 列表
+
+        从开局当天的分段开始顺序扫描，跨过零点的对局继续读次日的分段。
+        """
+        try:
+            started = game_started(game_id)
+            days = [time.strftime("%Y%m%d", time.localtime(started + offset * 86400)) for offset in range(2)]
+        except (ValueError, OverflowError, OSError):
+            return []
+        events = []
+        gid = game_id.encode("utf-8")
+        for day in days:
+            path = self.segment_path(day)
+            if os.path.exists(path):
+                events.extend(self._scan(path, gid))
+            if events and events[-1][0] == EVENT_END:
+                break
+        return events
+
+    def _scan(self, path: str, gid: bytes):
+        with open(path, "rb", buffering=1 << 16) as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return  # 文件末尾，或写到一半的残缺记录
+                size, event, stamp, gid_size = RECORD_HEADER.unpack(header)
+                if f.read(gid_size) != gid:
+                    f.seek(size, os.SEEK_CUR)
+                    continue
+                body = f.read(size)
+                if len(body) < size:
+                    return
+                try:
+                    yield event, stamp, json.loads(body.decode("utf-8"))
+                except ValueError:
+                    continue
@@ -1,212 +1,700 @@
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
 from astrbot.api.star import Context, Star, register
-from astrbot.api import logger
+from astrbot.api import logger, AstrBotConfig
+from astrbot.api.message_components import At
+import asyncio
+import bisect
+import difflib
 import random
-import json
-import os
+import sys
+import time
+from collections import OrderedDict
+from enum import Enum
+from itertools import islice
+
+from .broadcast import RoomBroadcaster
+from .game_log import (EVENT_ELIMINATE, EVENT_END, EVENT_LEAVE, EVENT_SPEECH, EVENT_START, EVENT_VOTE,
+                       GameLog, make_game_id)
+from .metrics import Metrics
+from .scheduler import DeadlineScheduler
+from .similarity import SimilarityIndex
+from .router import CommandContext, CommandRouter, HasStatus, InAnyRoom, InRoom, IsAdmin, IsAlive, IsOwner
+from .state_store import create_state_store
+from .stats_store import Leaderboard, create_stats_store
+from .templates import Templates, get_templates
+from .word_store import RecentRing, WordPairFile, WordPairStore, make_tag, parse_entry, read_pairs_file
 
 # 数据类定义
+class Role(Enum):
+    """玩家身份"""
+    CITIZEN = "citizen"
+    UNDERCOVER = "undercover"
+
+class RoomStatus(Enum):
+    """房间状态"""
+    WAITING = "waiting"
+    PLAYING = "playing"
+    ENDED = "ended"
+
+# list 指令可用的状态筛选参数（英文状态名或中文名称）
+ROOM_STATUS_FILTERS = {status.value: status for status in RoomStatus}
+ROOM_STATUS_FILTERS.update({"等待中": RoomStatus.WAITING, "游戏中": RoomStatus.PLAYING, "已结束": RoomStatus.ENDED})
+WORD_PAIRS_STATES = ("unloaded", "loading", "ready")  # 词语库的加载状态
+
+
 class Player:
     """玩家类"""
-    def __init__(self, user_id, user_name):
+    __slots__ = ("user_id", "user_name", "session", "is_alive", "role", "word", "seat")
+    
+    def __init__(self, user_id, user_name, session=None):
         self.user_id = user_id
         self.user_name = user_name
+        self.session = session  # 加入房间时所在会话的 unified_msg_origin，用于主动推送
         self.is_alive = True
-        self.role = None  # citizen, undercover, whiteboard
+        self.role = None  # Role
         self.word = None
+        self.seat = 0  # 座位号，从 1 开始，游戏开始后固定
+
+class PlayerNameIndex:
+    """玩家昵称索引，用于投票时解析目标玩家
+
+    依次尝试：精确匹配 -> 唯一前缀匹配（有序列表 + 二分查找）-> 模糊匹配。
+    随玩家加入、离开、淘汰增量更新。
+    """
+    __slots__ = ("_exact", "_sorted")
+    
+    def __init__(self):
+        self._exact = {}  # 昵称: {user_id: Player}
+        self._sorted = []  # (昵称, user_id) 有序列表
+    
+    def add(self, player: Player):
+        self._exact.setdefault(player.user_name, {})[player.user_id] = player
+        bisect.insort(self._sorted, (player.user_name, player.user_id))
+    
+    def remove(self, player: Player):
+        players = self._exact.get(player.user_name)
+        if not players or player.user_id not in players:
+            return
+        del players[player.user_id]
+        if not players:
+            del self._exact[player.user_name]
+        key = (player.user_name, player.user_id)
+        idx = bisect.bisect_left(self._sorted, key)
+        if idx < len(self._sorted) and self._sorted[idx] == key:
+            self._sorted.pop(idx)
+    
+    def exact(self, name: str) -> list:
+        """昵称完全一致的玩家列表"""
+        return list(self._exact.get(name, {}).values())
+    
+    def match(self, query: str) -> list:
+        """返回匹配的玩家列表，多于一个表示存在歧义"""
+        if query in self._exact:
+            return self.exact(query)
+        
+        # 前缀匹配：所有以 query 开头的昵称在有序列表中连续排列
+        start = bisect.bisect_left(self._sorted, (query,))
+        prefixed = []
+        for name, _ in self._sorted[start:]:
+            if not name.startswith(query):
+                break
+            prefixed.append(name)
+        if prefixed:
+            return self._players_named(prefixed)
+        
+        # 模糊匹配：先按包含关系，再按相似度
+        contained = [name for name in self._exact if query in name]
+        if contained:
+            return self._players_named(contained)
+        return self._players_named(difflib.get_close_matches(query, list(self._exact), n=3, cutoff=0.6))
+    
+    def _players_named(self, names) -> list:
+        players = {}
+        for name in names:
+            players.update(self._exact[name])
+        return list(players.values())
 
 class GameRoom:
     """游戏房间类"""
-    def __init__(self, room_id, owner_id, owner_name):
+    __slots__ = ("room_id", "owner_id", "owner_name", "players", "status", "speech_order",
+                 "current_speaker_index", "votes", "round", "last_active", "phase_seq", "seed", "scope", "game_id", "spectators", "roster_cache", "players_by_id", "players_by_seat",
+                 "name_index", "alive_ids", "alive_roles", "vote_counts", "_vote_buckets", "max_votes")
+    
+    def __init__(self, room_id, owner_id, owner_name, seed=None, scope=""):
         self.room_id = room_id
+        self.scope = scope  # 房间所属会话的 unified_msg_origin，房间号在会话内唯一
         self.owner_id = owner_id
         self.owner_name = owner_name
         self.players = []  # Player对象列表
-        self.status = "waiting"  # waiting, playing, ended
+        self.status = RoomStatus.WAITING
         self.speech_order = []  # 发言顺序，存储player对象
         self.current_speaker_index = 0  # 当前发言玩家索引
         self.votes = {}  # user_id: voted_user_id
         self.round = 1  # 当前轮次
+        self.last_active = time.time()  # 最近一次有玩家操作的时间
+        self.phase_seq = 0  # 阶段序号，每次重设阶段定时器时递增，用于识别过期的超时回调
+        self.seed = seed if seed is not None else random.getrandbits(64)  # 随机种子，决定洗牌、身份和抽词
+        self.game_id = ""  # 对局编号，开局时生成，用于对局日志和回放
+        self.spectators = {}  # 观战者 user_id: 观战时所在会话的 unified_msg_origin
+        # 以下为增量维护的索引，请通过下方方法修改玩家与投票
+        self.players_by_id = {}  # user_id: Player对象
+        self.players_by_seat = {}  # 座位号: Player对象
+        self.name_index = PlayerNameIndex()  # 存活玩家昵称索引
+        self.alive_ids = set()  # 存活玩家的 user_id
+        self.alive_roles = {}  # role: 存活人数
+        self.vote_counts = {}  # 被投票的 user_id: 得票数
+        self._vote_buckets = {}  # 得票数: {user_id: None}，按得票分桶，用作有序集合
+        self.max_votes = 0  # 当前最高得票数
+        self.roster_cache = None  # 渲染好的存活玩家名单，玩家加入、离开或被淘汰时清空
+    
+    @property
+    def key(self) -> tuple:
+        """全局唯一的房间键 (会话, 房间号)，用于房间锁和定时器"""
+        return (self.scope, self.room_id)
+    
+    def touch(self):
+        """刷新最近活动时间"""
+        self.last_active = time.time()
+    
+    def estimate_size(self) -> int:
+        """粗略估算房间占用的内存（字节）"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.players) + sys.getsizeof(self.speech_order)
+        for container in (self.votes, self.players_by_id, self.players_by_seat, self.alive_ids,
+                          self.vote_counts, self._vote_buckets):
+            size += sys.getsizeof(container)
+        for player in self.players:
+            size += sys.getsizeof(player) + sys.getsizeof(player.user_name)
+        return size
+    
+    def add_player(self, player: Player):
+        """添加玩家"""
+        self.players.append(player)
+        self.players_by_id[player.user_id] = player
+        player.seat = len(self.players)
+        self.players_by_seat[player.seat] = player
+        self.roster_cache = None
+        if player.is_alive:
+            self.alive_ids.add(player.user_id)
+            self.name_index.add(player)
+    
+    def get_player(self, user_id):
+        """按 user_id 查找玩家，不存在时返回 None"""
+        return self.players_by_id.get(user_id)
+    
+    def remove_player(self, user_id):
+        """移除玩家，同时撤销其投出和收到的选票，返回被移除的玩家"""
+        player = self.players_by_id.pop(user_id, None)
+        if player is None:
+            return None
+        self.players.remove(player)
+        self.roster_cache = None
+        if self.players_by_seat.get(player.seat) is player:
+            del self.players_by_seat[player.seat]
+        if user_id in self.alive_ids:
+            self.alive_ids.discard(user_id)
+            self._dec_alive_role(player.role)
+            self.name_index.remove(player)
+        if user_id in self.votes:
+            self._retract_vote(user_id)
+        for voter_id in [v for v, t in self.votes.items() if t == user_id]:
+            self._retract_vote(voter_id)
+        if player in self.speech_order:
+            idx = self.speech_order.index(player)
+            self.speech_order.pop(idx)
+            if idx < self.current_speaker_index:
+                self.current_speaker_index -= 1
+        return player
+    
+    def rng_for(self, round_no: int) -> random.Random:
+        """第 round_no 轮使用的随机数生成器
+
+        由房间种子和轮次确定，同一种子在相同操作序列下得到相同的对局；
+        只需持久化种子即可在恢复后继续得到一致的结果。
+        """
+        return random.Random(f"{self.seed}:{round_no}")
+    
+    def assign_seats(self):
+        """按当前玩家顺序重新编排座位号"""
+        self.players_by_seat = {}
+        self.roster_cache = None
+        for seat, player in enumerate(self.players, 1):
+            player.seat = seat
+            self.players_by_seat[seat] = player
+    
+    def find_alive_players(self, query: str, mention_ids=()) -> list:
+        """解析投票目标，返回匹配的存活玩家列表
+
+        优先使用 @ 提及的玩家，其次按昵称精确匹配，再按座位号（#3 或 3），
+        最后按前缀和模糊匹配。
+        """
+        for user_id in mention_ids:
+            if user_id in self.alive_ids:
+                return [self.players_by_id[user_id]]
+        query = query.strip().lstrip("@")
+        if not query:
+            return []
+        players = self.name_index.exact(query)
+        if players:
+            return players
+        seat = query[1:] if query.startswith("#") else query
+        if seat.isdecimal():
+            player = self.players_by_seat.get(int(seat))
+            if player is not None and player.user_id in self.alive_ids:
+                return [player]
+        return self.name_index.match(query)
+    
+    def alive_players(self) -> list:
+        """存活玩家列表，保持座位顺序"""
+        return [p for p in self.players if p.user_id in self.alive_ids]
+    
+    def to_dict(self) -> dict:
+        """导出房间快照，用于持久化"""
+        return {
+            "room_id": self.room_id,
+            "scope": self.scope,
+            "owner_id": self.owner_id,
+            "owner_name": self.owner_name,
+            "status": self.status.value,
+            "round": self.round,
+            "current_speaker_index": self.current_speaker_index,
+            "last_active": self.last_active,
+            "seed": self.seed,
+            "game_id": self.game_id,
+            "players": [
+                {
+                    "user_id": p.user_id,
+                    "user_name": p.user_name,
+                    "session": p.session,
+                    "is_alive": p.is_alive,
+                    "role": p.role.value if p.role else None,
+                    "word": p.word,
+                    "seat": p.seat,
+                }
+                for p in self.players
+            ],
+            "speech_order": [p.user_id for p in self.speech_order],
+            "votes": dict(self.votes),
+            "spectators": dict(self.spectators),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "GameRoom":
+        """从快照恢复房间，并重建各项索引"""
+        room = cls(data["room_id"], data["owner_id"], data["owner_name"], data.get("seed"), data.get("scope", ""))
+        room.status = RoomStatus(data["status"])
+        room.round = data["round"]
+        room.current_speaker_index = data["current_speaker_index"]
+        room.last_active = data["last_active"]
+        room.game_id = data.get("game_id", "")
+        room.spectators = dict(data.get("spectators", {}))
+        for item in data["players"]:
+            player = Player(item["user_id"], item["user_name"], item.get("session"))
+            player.is_alive = item["is_alive"]
+            player.role = Role(item["role"]) if item["role"] else None
+            player.word = item["word"]
+            room.add_player(player)
+            player.seat = item["seat"]
+        room.players_by_seat = {p.seat: p for p in room.players}
+        room.refresh_alive_roles()
+        room.speech_order = [room.players_by_id[u] for u in data["speech_order"] if u in room.players_by_id]
+        for voter_id, target_id in data["votes"].items():
+            if voter_id in room.players_by_id and target_id in room.players_by_id:
+                room.cast_vote(voter_id, target_id)
+        return room
+    
+    def refresh_alive_roles(self):
+        """身份分配后重新统计各身份存活人数"""
+        self.alive_roles = {}
+        for user_id in self.alive_ids:
+            role = self.players_by_id[user_id].role
+            self.alive_roles[role] = self.alive_roles.get(role, 0) + 1
+    
+    def count_alive(self, role) -> int:
+        return self.alive_roles.get(role, 0)
+    
+    def eliminate(self, player: Player):
+        """淘汰玩家"""
+        player.is_alive = False
+        if player.user_id in self.alive_ids:
+            self.alive_ids.discard(player.user_id)
+            self._dec_alive_role(player.role)
+            self.name_index.remove(player)
+            self.roster_cache = None
+    
+    def cast_vote(self, voter_id, target_id):
+        """记录投票，重复投票时改票，得票统计增量更新"""
+        if voter_id in self.votes:
+            self._retract_vote(voter_id)
+        self.votes[voter_id] = target_id
+        count = self.vote_counts.get(target_id, 0)
+        if count:
+            self._bucket_discard(count, target_id)
+        self.vote_counts[target_id] = count + 1
+        self._vote_buckets.setdefault(count + 1, {})[target_id] = None
+        if count + 1 > self.max_votes:
+            self.max_votes = count + 1
+    
+    def all_voted(self) -> bool:
+        """所有存活玩家是否都已投票"""
+        return len(self.votes) >= len(self.alive_ids)
+    
+    def vote_leaders(self) -> list:
+        """当前得票最高的玩家列表"""
+        if not self.max_votes:
+            return []
+        return [self.players_by_id[u] for u in self._vote_buckets.get(self.max_votes, ())]
+    
+    def clear_votes(self):
+        """清空本轮投票"""
+        self.votes.clear()
+        self.vote_counts.clear()
+        self._vote_buckets.clear()
+        self.max_votes = 0
+    
+    def _retract_vote(self, voter_id):
+        target_id = self.votes.pop(voter_id)
+        count = self.vote_counts[target_id]
+        self._bucket_discard(count, target_id)
+        if count == 1:
+            del self.vote_counts[target_id]
+        else:
+            self.vote_counts[target_id] = count - 1
+            self._vote_buckets.setdefault(count - 1, {})[target_id] = None
+        # 每次只减一票，若最高桶被清空，新的最高票必然是 count - 1
+        if count == self.max_votes and count not in self._vote_buckets:
+            self.max_votes = count - 1
+    
+    def _bucket_discard(self, count, target_id):
+        bucket = self._vote_buckets[count]
+        del bucket[target_id]
+        if not bucket:
+            del self._vote_buckets[count]
+    
+    def _dec_alive_role(self, role):
+        if self.alive_roles.get(role):
+            self.alive_roles[role] -= 1
+
+# 子指令路由表，处理函数通过 @router.command 注册
+router = CommandRouter()
+
+class RoomShard:
+    """单个会话（按 unified_msg_origin 区分的群聊或私聊）内的房间状态
+
+    每个会话有独立的房间号空间，列表、加入、清理等操作只涉及本会话的房间，
+    不同群之间互不可见，同一用户也可以同时在不同群的房间中。
+    """
+    __slots__ = ("scope", "game_rooms", "user_rooms", "rooms_by_status", "room_counter", "recent_pairs", "queue",
+                 "_list_cache")
+    
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.game_rooms = {}  # room_id: GameRoom对象
+        self.user_rooms = {}  # user_id: room_id，记录用户在本会话中所在的房间
+        self.rooms_by_status = {status: {} for status in RoomStatus}  # 状态: {room_id: None}，按进入该状态的先后排序
+        self.room_counter = 1  # 房间ID计数器
+        self.recent_pairs = None  # RecentRing，本会话最近抽到的词语对下标，首次开局时创建
+        self.queue = OrderedDict()  # user_id: (Player, 入队时间)，自动匹配队列，按入队先后排序
+        self._list_cache = {}  # (状态筛选, 页码): 渲染好的列表文本，房间变化时清空
+    
+    def __len__(self):
+        return len(self.game_rooms)
+    
+    def storage_key(self, room_id: str) -> str:
+        """房间在状态存储中的键"""
+        return f"{self.scope}/{room_id}"
+    
+    def next_room_id(self) -> str:
+        room_id = str(self.room_counter)
+        self.room_counter += 1
+        return room_id
+    
+    def invalidate(self):
+        """房间或玩家人数变化后清空列表缓存"""
+        self._list_cache.clear()
+    
+    def add_room(self, game_room: GameRoom):
+        """登记新房间并加入状态索引"""
+        self.game_rooms[game_room.room_id] = game_room
+        self.rooms_by_status[game_room.status][game_room.room_id] = None
+        self.invalidate()
+    
+    def set_room_status(self, game_room: GameRoom, status: RoomStatus):
+        """切换房间状态，同步更新状态索引"""
+        self.rooms_by_status[game_room.status].pop(game_room.room_id, None)
+        game_room.status = status
+        self.rooms_by_status[status][game_room.room_id] = None
+        self.invalidate()
+    
+    def pop_room(self, room_id: str):
+        """移出房间和状态索引，返回被移出的房间（玩家所在房间记录由调用方释放）"""
+        game_room = self.game_rooms.pop(room_id, None)
+        if game_room is not None:
+            self.rooms_by_status[game_room.status].pop(room_id, None)
+            self.invalidate()
+        return game_room
+    
+    def render_room_list(self, t: Templates, page: int, status: RoomStatus = None, page_size: int = 10) -> str:
+        """渲染一页房间列表，结果缓存到房间下次变化为止"""
+        key = (status, page)
+        text = self._list_cache.get(key)
+        if text is not None:
+            return text
+        room_ids = self.rooms_by_status[status] if status is not None else self.game_rooms
+        total = len(room_ids)
+        if not total:
+            text = t("no_rooms") if status is None else t("no_rooms_with_status", status=t.status_name(status))
+        else:
+            pages = (total + page_size - 1) // page_size
+            if not 1 <= page <= pages:
+                return t("page_out_of_range", pages=pages)
+            start = (page - 1) * page_size
+            lines = [t("list_header", page=page, pages=pages, total=total)]
+            for room_id in islice(room_ids, start, start + page_size):
+                game_room = self.game_rooms[room_id]
+                lines.append(t("list_item", room_id=room_id, status=game_room.status.value, players=len(game_room.players)))
+            if page < pages:
+                suffix = f" {status.value}" if status is not None else ""
+                lines.append(t("list_next_page", page=page + 1, suffix=suffix))
+            text = "\n".join(lines)
+        self._list_cache[key] = text
+        return text
+
 
 # 主插件类
 @register("undercover", "YourName", "谁是卧底游戏插件", "1.1.2")
 class UndercoverPlugin(Star):
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, config: AstrBotConfig = None):
         super().__init__(context)
-        self.game_rooms = {}  # room_id: GameRoom对象
-        self.user_rooms = {}  # user_id: room_id，记录用户所在房间
+        self.config = config if config is not None else {}
+        self.t = get_templates(self.config.get("language", "zh"))  # 消息模板
+        self.shards = {}  # unified_msg_origin: RoomShard，各会话的房间互相隔离
+        self.user_scopes = {}  # user_id: {unified_msg_origin: None}，用户有房间的会话，供私聊查词跨会话查找
+        self.list_page_size = self.config.get("list_page_size", 10)  # 房间列表每页条数
         self.word_pairs_file = "word_pairs.json"  # 词语库文件
-        self.word_pairs = self.load_word_pairs()  # 加载词语库
-        self.room_counter = 1  # 房间ID计数器
+        self.word_pairs_io = WordPairFile(self.word_pairs_file)  # 词语库快照 + 追加日志
+        self.word_pairs_compact_threshold = 1000  # 日志累积多少条后压缩进快照
+        self._word_pairs_lock = asyncio.Lock()  # 串行化日志追加与快照压缩
+        self._compact_task = None
+        self.word_pairs = None  # 词语库，首次使用或后台加载完成后才可用
+        self.word_pairs_state = "unloaded"  # WORD_PAIRS_STATES 之一，统计中显示，开局时据此提示等待
+        self.recent_pairs_size = self.config.get("recent_pairs", 20)  # 每个会话避免重复出题的最近词语对数
+        # 自动匹配：凑满 queue_size 人立即开局，最早入队者等待超过 queue_timeout 秒时人数够 3 人也开局
+        self.queue_size = max(3, self.config.get("queue_size", 6))
+        self.queue_timeout = self.config.get("queue_timeout", 60)
+        # 词语对入库前的相似度检查，向量矩阵随词语库在后台构建
+        self.similarity = SimilarityIndex(
+            max_similarity=self.config.get("pair_max_similarity", 0.8),
+            min_similarity=self.config.get("pair_min_similarity", 0.2),
+            near_duplicate=self.config.get("near_duplicate_similarity", 0.75),
+        )
+        # 检查在线程中进行，串行化检查与入库，保证向量矩阵的行按词库下标顺序追加
+        self._similarity_lock = asyncio.Lock()
+        self._word_pairs_ready = asyncio.Event()  # 词语列表可用于抽取
+        self._word_pairs_task = None  # 后台加载任务，完成时判重索引也已就绪
+        # 房间种子的来源；random_seed 为非负数（包括 0）时对局可复现，未配置或为负数时使用系统熵
+        random_seed = self.config.get("random_seed")
+        self.seed_source = random.Random(random_seed if random_seed is not None and random_seed >= 0 else None)
+        self.scheduler = DeadlineScheduler()  # 共享定时器
+        # 各状态房间的空闲超时（秒），超时后由定时器回收
+        self.room_ttls = {
+            RoomStatus.WAITING: self.config.get("room_ttl_waiting", 1800),
+            RoomStatus.PLAYING: self.config.get("room_ttl_playing", 3600),
+            RoomStatus.ENDED: self.config.get("room_ttl_ended", 300),
+        }
+        self.gc_stats = {"rooms_evicted": 0, "bytes_reclaimed": 0}  # 房间回收统计
+        self._room_locks = {}  # (会话, room_id): asyncio.Lock，串行化同一房间的状态修改
+        # 房间状态持久化后端，重启或重载插件后恢复进行中的游戏
+        self.state_store = create_state_store(self.config.get("state_backend", "sqlite"), "undercover_state.db")
+        self.state_flush_interval = self.config.get("state_flush_interval", 1.0)  # 批量写入间隔（秒）
+        # 玩家战绩：每局结束时增量更新排行榜，并与房间状态一起批量写入存储
+        self.stats_store = create_stats_store(self.config.get("state_backend", "sqlite"), "undercover_stats.db")
+        self.leaderboards = {}  # unified_msg_origin: Leaderboard
+        # 对局事件日志，按天分段追加写入，随房间状态一起批量写出；目录为空时不记录
+        game_log_dir = self.config.get("game_log_dir", "undercover_logs")
+        self.game_log = GameLog(game_log_dir) if game_log_dir else None
+        self.rooms_by_game = {}  # 对局编号: GameRoom，供其他会话按对局编号观战
+        self.spectating = {}  # 观战者 user_id: 所观战房间的 (会话, 房间号)，每人同时只观战一个房间
+        # 发言和投票阶段的时限（秒），超时自动跳过发言者或按弃权结算，0 表示不限时
+        self.speech_timeout = self.config.get("speech_timeout", 120)
+        self.vote_timeout = self.config.get("vote_timeout", 120)
+        # 房间广播：按会话合并消息，按平台限速后主动推送
+        self.broadcaster = RoomBroadcaster(
+            context,
+            rate=self.config.get("broadcast_rate", 2.0),
+            burst=self.config.get("broadcast_burst", 5),
+            queue_size=self.config.get("broadcast_queue_size", 1000),
+        )
+        # 运行指标：子指令计数与抽样计时，定期导出到文件
+        self.metrics = Metrics(self.config.get("metrics_sample_every", 4))
+        self.metrics_file = self.config.get("metrics_file", "undercover_metrics.prom")
+        self.metrics_interval = self.config.get("metrics_interval", 60)  # 导出间隔（秒），0 表示不导出
     
     async def initialize(self):
         """插件初始化"""
+        self.scheduler.start()
+        try:
+            await self.state_store.open()
+            await self.restore_rooms()
+        except Exception as e:
+            logger.error(f"恢复房间状态失败：{e}")
+        try:
+            await self.stats_store.open()
+            await self.restore_stats()
+        except Exception as e:
+            logger.error(f"加载玩家战绩失败：{e}")
+        if self.metrics_file and self.metrics_interval > 0:
+            self.scheduler.schedule(("metrics_dump",), self.metrics_interval, self.dump_metrics)
         logger.info("谁是卧底插件初始化成功")
-        # 确保词语库文件存在
-        if not os.path.exists(self.word_pairs_file):
-            self.save_word_pairs(self.get_default_word_pairs())
-            self.word_pairs = self.get_default_word_pairs()
+        # 在后台加载词语库，不阻塞 AstrBot 启动
+        self._start_loading_word_pairs()
     
     # 指令处理函数
     @filter.command("undercover")
     async def undercover(self, event: AstrMessageEvent):
         """主指令入口，处理所有子指令"""
-        message_str = event.message_str.strip()
-        args = message_str.split()[1:] if len(message_str.split()) > 1 else []
+        args = event.message_str.split()[1:]
         
         if not args:
-            # 显示帮助信息
-            help_text = "谁是卧底游戏指令：\n"
-            help_text += "/undercover create - 创建游戏房间\n"
-            help_text += "/undercover join <房间号> - 加入游戏房间\n"
-            help_text += "/undercover start - 开始游戏（房主）\n"
-            help_text += "/undercover leave - 离开当前房间\n"
-            help_text += "/undercover say <内容> - 游戏中发言\n"
-            help_text += "/undercover vote <玩家> - 游戏中投票\n"
-            help_text += "/undercover end - 结束游戏（房主）\n"
-            help_text += "/undercover add <词语1> <词语2> - 添加词语对\n"
-            help_text += "/undercover word - 查看我的词语(请私聊使用)\n"
-            help_text += "/undercover list - 查看游戏列表\n"
-            yield event.plain_result(help_text)
-            return
-        
-        sub_cmd = args[0].lower()
-        
-        # 根据子指令分发处理
-        if sub_cmd == "create":
-            async for result in self.create_game(event):
-                yield result
-        elif sub_cmd == "join":
-            async for result in self.join_game(event, args[1] if len(args) > 1 else ""):
-                yield result
-        elif sub_cmd == "start":
-            async for result in self.start_game(event):
-                yield result
-        elif sub_cmd == "leave":
-            async for result in self.leave_game(event):
-                yield result
-        elif sub_cmd == "say":
-            async for result in self.say(event, " ".join(args[1:])):
-                yield result
-        elif sub_cmd == "vote":
-            async for result in self.vote(event, " ".join(args[1:])):
-                yield result
-        elif sub_cmd == "end":
-            async for result in self.end_game(event):
-                yield result
-        elif sub_cmd == "add":
-            async for result in self.add_word_pair(event, args[1] if len(args) > 1 else "", args[2] if len(args) > 2 else ""):
-                yield result
-        elif sub_cmd == "word":
-            async for result in self.get_word(event):
-                yield result
-        elif sub_cmd == "list":
-            async for result in self.list_games(event):
-                yield result
-        else:
-            yield event.plain_result("未知指令，请输入 /undercover 查看帮助")
+            # 显示帮助信息（加载语言包时已拼好）
+            yield event.plain_result(self.t.help_text)
+            return
+        
+        # 查表分发子指令
+        spec = router.resolve(args[0])
+        if spec is None:
+            yield event.plain_result(self.t("unknown_command"))
+            return
+        
+        ctx = CommandContext(event, args[1:])
+        ctx.shard = self.get_shard(event.unified_msg_origin)
+        handler = router.dispatch(self, spec, ctx)
+        if spec.locked:
+            # 会修改房间状态的指令在房间锁内执行，前置条件也在锁内检查
+            room_id = ctx.arg(spec.room_arg) if spec.room_arg is not None else None
+            handler = self.run_in_room(event, handler, ctx.shard, room_id)
+        # 先收集回复再返回，计时不包含框架发送回复的时间
+        start = self.metrics.begin(spec.name)
+        results = [result async for result in handler]
+        self.metrics.end(spec.name, start)
+        for result in results:
+            yield result
+        
+        # 刷新发送者所在房间的活动时间，供空闲回收判断
+        game_room = ctx.shard.game_rooms.get(ctx.shard.user_rooms.get(ctx.user_id))
+        if game_room is not None:
+            game_room.touch()
     
     # 游戏逻辑函数
-    async def create_game(self, event: AstrMessageEvent):
+    @router.command("create", aliases=("创建",))
+    async def create_game(self, ctx: CommandContext):
         """创建游戏房间"""
-        user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
+        event, user_id, user_name = ctx.event, ctx.user_id, ctx.user_name
         
-        # 检查用户是否已在其他房间
-        if user_id in self.user_rooms:
-            yield event.plain_result("你已在其他游戏房间中，请先离开")
+        shard = ctx.shard = self.register_shard(ctx.shard)
+        
+        # 检查用户是否已在本会话的其他房间
+        if user_id in shard.user_rooms:
+            yield event.plain_result(self.t("already_in_other_room"))
             return
         
         # 创建新房间
-        room_id = str(self.room_counter)
-        self.room_counter += 1
+        game_room = self.open_room(shard, Player(user_id, user_name, event.unified_msg_origin))
+        yield event.plain_result(self.t("room_created", room_id=game_room.room_id, owner=user_name))
+    
+    def open_room(self, shard: RoomShard, owner: Player) -> GameRoom:
+        """在会话中创建新房间，owner 成为房主"""
+        room_id = shard.next_room_id()
         
-        game_room = GameRoom(room_id, user_id, user_name)
-        self.game_rooms[room_id] = game_room
+        game_room = GameRoom(room_id, owner.user_id, owner.user_name, self.seed_source.getrandbits(64), shard.scope)
+        shard.add_room(game_room)
+        self.schedule_room_gc(game_room)
         
         # 添加房主到房间
-        player = Player(user_id, user_name)
-        game_room.players.append(player)
-        self.user_rooms[user_id] = room_id
-        
-        yield event.plain_result(f"游戏房间创建成功！房间号：{room_id}\n" 
-                                f"房主：{user_name}\n" 
-                                f"使用 /undercover join {room_id} 邀请其他玩家加入")
+        game_room.add_player(owner)
+        self.bind_user(shard, owner.user_id, room_id)
+        self.state_store.stage_meta(f"room_counter/{shard.scope}", shard.room_counter)
+        self.save_room(shard, room_id)
+        return game_room
     
-    async def join_game(self, event: AstrMessageEvent, room_id: str):
+    @router.command("join", aliases=("加入",), locked=True, room_arg=0)
+    async def join_game(self, ctx: CommandContext):
         """加入游戏房间"""
-        user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
+        event, user_id, user_name, shard = ctx.event, ctx.user_id, ctx.user_name, ctx.shard
+        room_id = ctx.arg(0)
         
         if not room_id:
-            yield event.plain_result("请输入房间号，格式：/undercover join <房间号>")
+            yield event.plain_result(self.t("join_usage"))
             return
         
         # 检查房间是否存在
-        if room_id not in self.game_rooms:
-            yield event.plain_result("房间不存在，请检查房间号")
+        game_room = shard.game_rooms.get(room_id)
+        if game_room is None:
+            yield event.plain_result(self.t("room_not_found"))
             return
         
-        game_room = self.game_rooms[room_id]
-        
         # 检查房间状态
-        if game_room.status != "waiting":
-            yield event.plain_result("该房间游戏已开始，无法加入")
+        if game_room.status is not RoomStatus.WAITING:
+            yield event.plain_result(self.t("room_already_started"))
             return
         
         # 检查用户是否已在该房间
-        if user_id in self.user_rooms and self.user_rooms[user_id] == room_id:
-            yield event.plain_result("你已在该房间中")
+        if shard.user_rooms.get(user_id) == room_id:
+            yield event.plain_result(self.t("already_in_room"))
             return
         
-        # 检查用户是否已在其他房间
-        if user_id in self.user_rooms:
-            yield event.plain_result("你已在其他游戏房间中，请先离开")
+        # 检查用户是否已在本会话的其他房间
+        if user_id in shard.user_rooms:
+            yield event.plain_result(self.t("already_in_other_room"))
             return
         
         # 添加用户到房间
-        player = Player(user_id, user_name)
-        game_room.players.append(player)
-        self.user_rooms[user_id] = room_id
+        player = Player(user_id, user_name, event.unified_msg_origin)
+        game_room.add_player(player)
+        self.bind_user(shard, user_id, room_id)
         
         # 通知房间内所有玩家
-        async for r in self.notify_room(event, f"玩家 {user_name} 加入了游戏"):
-            yield r
-        yield event.plain_result(f"成功加入房间 {room_id}")
+        self.notify_room(game_room, self.t("player_joined", name=user_name))
+        yield event.plain_result(self.t("joined_room", room_id=room_id))
     
-    async def start_game(self, event: AstrMessageEvent):
+    @router.command("start", aliases=("开始",), locked=True, requires=(
+        InRoom(), IsOwner("owner_only_start"), HasStatus(RoomStatus.WAITING, "game_already_started")))
+    async def start_game(self, ctx: CommandContext):
         """开始游戏"""
-        user_id = event.get_sender_id()
-        
-        # 检查用户是否在房间中
-        if user_id not in self.user_rooms:
-            yield event.plain_result("你不在任何游戏房间中")
-            return
-        
-        room_id = self.user_rooms[user_id]
-        game_room = self.game_rooms[room_id]
-        
-        # 检查用户是否是房主
-        if game_room.owner_id != user_id:
-            yield event.plain_result("只有房主可以开始游戏")
-            return
-        
-        # 检查房间状态
-        if game_room.status != "waiting":
-            yield event.plain_result("游戏已开始")
-            return
+        event, game_room = ctx.event, ctx.room
         
         # 检查玩家数量
         if len(game_room.players) < 3:
-            yield event.plain_result("玩家数量不足，至少需要3人")
+            yield event.plain_result(self.t("not_enough_players"))
             return
         
-        # 开始游戏流程
-        game_room.status = "playing"
+        # 启动后词语库尚未加载完时先告知玩家，加载完成后继续开局
+        if self.word_pairs_state != "ready":
+            yield event.plain_result(self.t("word_pairs_loading"))
+        word_pairs = await self.ensure_word_pairs()
+        category, difficulty = self.parse_lexicon_filters(word_pairs, ctx.args)
+        error = self.begin_game(game_room, word_pairs, category, difficulty)
+        if error is not None:
+            yield event.plain_result(error)
+    
+    def begin_game(self, game_room: GameRoom, word_pairs: WordPairStore, category=None, difficulty=None):
+        """抽词、分配身份并开始第一轮发言（房间人数已检查），失败时返回回复文本"""
+        rng = game_room.rng_for(game_room.round)
+        
+        # 按分类和难度筛选后加权抽取词语对，跳过本会话最近用过的词语对
+        shard = self.shards[game_room.scope]
+        recent = self.get_recent_pairs(shard)
+        try:
+            index = word_pairs.sample(rng, category, difficulty, recent)
+        except LookupError:
+            categories = self.t.join_names(word_pairs.categories()) or "-"
+            return self.t("no_matching_word_pairs", categories=categories)
+        recent.push(index)
+        self.state_store.stage_meta(f"recent_pairs/{shard.scope}", recent.to_list())
+        citizen_word, undercover_word = word_pairs[index]
         
-        # 随机选择词语对
-        word_pair = random.choice(self.word_pairs)
-        citizen_word, undercover_word = word_pair
+        # 开始游戏流程
+        self.set_room_status(game_room, RoomStatus.PLAYING)
+        self.schedule_room_gc(game_room)
         
         # 分配身份
         num_players = len(game_room.players)
@@ -218,50 +706,174 @@ class UndercoverPlugin(Star):
         else:
             num_undercover = 3
         
-        # 随机打乱玩家顺序
-        random.shuffle(game_room.players)
+        # 随机打乱玩家顺序并编排座位号
+        rng.shuffle(game_room.players)
+        game_room.assign_seats()
         
-        # 分配身份和词语
+        # 分配身份和词语（卧底独立抽取，避免座位号或发言顺序暴露身份）
+        undercover_seats = set(rng.sample(range(num_players), num_undercover))
         for i, player in enumerate(game_room.players):
-            if i < num_undercover:
-                player.role = "undercover"
+            if i in undercover_seats:
+                player.role = Role.UNDERCOVER
                 player.word = undercover_word
             else:
-                player.role = "citizen"
+                player.role = Role.CITIZEN
                 player.word = citizen_word
         
+        game_room.refresh_alive_roles()
+        game_room.game_id = make_game_id(time.time(), game_room.seed)
+        self.log_event(game_room, EVENT_START, room=game_room.room_id, words=[citizen_word, undercover_word],
+                       players=[[p.seat, p.user_name, p.role.value, p.word] for p in game_room.players])
+        
         # 设置发言顺序
         game_room.speech_order = game_room.players.copy()
         game_room.current_speaker_index = 0
         
         # 通知所有玩家游戏开始
-        async for r in self.notify_room(event, "游戏开始！\n" 
-                              f"本轮词语：[机密]\n" 
-                              f"玩家列表：{', '.join(p.user_name for p in game_room.players)}\n"
-                              "请私聊机器人发送 /undercover word 查看你的词语"):
-            yield r
+        self.rooms_by_game[game_room.game_id] = game_room
+        message = self.t("game_started", roster=self.t.roster(game_room))
+        self.notify_room(game_room, message + "\n" + self.t("watch_hint", game_id=game_room.game_id))
         
         # 通知当前发言玩家
         current_player = game_room.speech_order[game_room.current_speaker_index]
-        async for r in self.notify_room(event, f"第 {game_room.round} 轮发言开始！\n" 
-                              f"当前发言玩家：{current_player.user_name}"):
-            yield r
+        self.notify_room(game_room, self.t("round_started", round=game_room.round, speaker=current_player.user_name))
+        self.arm_phase_timer(game_room)
+        return None
     
-    async def leave_game(self, event: AstrMessageEvent):
-        """离开游戏房间"""
-        user_id = event.get_sender_id()
+    @router.command("queue", aliases=("匹配",))
+    async def join_queue(self, ctx: CommandContext):
+        """加入或退出本会话的自动匹配队列"""
+        event, user_id, t = ctx.event, ctx.user_id, self.t
+        
+        if ctx.arg(0).lower() in ("cancel", "取消"):
+            if ctx.shard.queue.pop(user_id, None) is None:
+                yield event.plain_result(t("not_in_queue"))
+                return
+            self.arm_queue_timer(ctx.shard)
+            yield event.plain_result(t("queue_left"))
+            return
         
-        if user_id not in self.user_rooms:
-            yield event.plain_result("你不在任何游戏房间中")
+        if user_id in ctx.shard.user_rooms:
+            yield event.plain_result(t("already_in_other_room"))
+            return
+        if user_id in ctx.shard.queue:
+            yield event.plain_result(t("queue_already", count=len(ctx.shard.queue), size=self.queue_size))
             return
         
-        room_id = self.user_rooms[user_id]
-        game_room = self.game_rooms[room_id]
-        user_name = event.get_sender_name()
+        shard = ctx.shard = self.register_shard(ctx.shard)
+        shard.queue[user_id] = (Player(user_id, ctx.user_name, event.unified_msg_origin), time.time())
+        if len(shard.queue) >= self.queue_size:
+            # 满员立即开局，开局通知经房间广播发送给每位玩家
+            await self.form_match(shard, self.queue_size)
+            return
+        self.arm_queue_timer(shard)
+        reply = t("queue_joined", count=len(shard.queue), size=self.queue_size)
+        if self.queue_timeout > 0:
+            reply += "\n" + t("queue_timeout_hint", timeout=self.queue_timeout)
+        yield event.plain_result(reply)
+    
+    def arm_queue_timer(self, shard: RoomShard):
+        """队列够 3 人时，按最早入队者的等待时限安排超时开局"""
+        key = ("queue", shard.scope)
+        if len(shard.queue) < 3 or self.queue_timeout <= 0:
+            self.scheduler.cancel(key)
+            return
+        _, enqueued_at = next(iter(shard.queue.values()))
+        scope = shard.scope
+        self.scheduler.schedule(key, enqueued_at + self.queue_timeout - time.time(),
+                                lambda: self._on_queue_timeout(scope))
+    
+    async def _on_queue_timeout(self, scope: str):
+        shard = self.shards.get(scope)
+        if shard is not None and len(shard.queue) >= 3:
+            await self.form_match(shard, self.queue_size)
+    
+    async def form_match(self, shard: RoomShard, size: int):
+        """从队首取出至多 size 名玩家组成房间并直接开局，不足 3 人时不开局"""
+        word_pairs = await self.ensure_word_pairs()
+        # 等待词语库期间可能有玩家退出队列，重新确认人数
+        size = min(size, len(shard.queue))
+        if size >= 3:
+            players = [shard.queue.popitem(last=False)[1][0] for _ in range(size)]
+            game_room = self.open_room(shard, players[0])
+            for player in players[1:]:
+                game_room.add_player(player)
+                self.bind_user(shard, player.user_id, game_room.room_id)
+            self.notify_room(game_room, self.t("match_found", room_id=game_room.room_id, owner=game_room.owner_name))
+            error = self.begin_game(game_room, word_pairs)
+            if error is not None:
+                self.notify_room(game_room, error)
+            self.save_room(shard, game_room.room_id)
+            self.broadcaster.flush()
+        self.arm_queue_timer(shard)
+    
+    @router.command("watch", aliases=("观战",))
+    async def watch_room(self, ctx: CommandContext):
+        """观战本会话的房间，或按对局编号观战其他会话中进行的游戏"""
+        event, user_id, target, t = ctx.event, ctx.user_id, ctx.arg(0), self.t
+        if not target:
+            yield event.plain_result(t("watch_usage"))
+            return
         
-        # 从房间中移除玩家
-        game_room.players = [p for p in game_room.players if p.user_id != user_id]
-        del self.user_rooms[user_id]
+        game_room = ctx.shard.game_rooms.get(target) or self.rooms_by_game.get(target)
+        if game_room is None:
+            yield event.plain_result(t("room_not_found"))
+            return
+        if user_id in game_room.players_by_id:
+            yield event.plain_result(t("already_in_room"))
+            return
+        if game_room.status is RoomStatus.ENDED:
+            yield event.plain_result(t("watch_ended"))
+            return
+        if self.spectating.get(user_id) == game_room.key:
+            # 重复观战时改为推送到本次发送指令的会话
+            game_room.spectators[user_id] = event.unified_msg_origin
+            yield event.plain_result(t("watch_already"))
+            return
+        
+        # 每人同时只观战一个房间，先退出之前的房间
+        self.stop_watching(user_id)
+        game_room.spectators[user_id] = event.unified_msg_origin
+        self.spectating[user_id] = game_room.key
+        self.save_room(self.shards[game_room.scope], game_room.room_id)
+        yield event.plain_result(t("watch_started", room_id=game_room.room_id, status=t.status_name(game_room.status),
+                                   players=len(game_room.players)))
+    
+    @router.command("unwatch", aliases=("取消观战",))
+    async def unwatch_room(self, ctx: CommandContext):
+        """退出观战"""
+        if self.stop_watching(ctx.user_id):
+            yield ctx.event.plain_result(self.t("watch_stopped"))
+        else:
+            yield ctx.event.plain_result(self.t("not_watching"))
+    
+    def stop_watching(self, user_id) -> bool:
+        """退出当前观战的房间，未在观战时返回 False"""
+        key = self.spectating.pop(user_id, None)
+        if key is None:
+            return False
+        scope, room_id = key
+        shard = self.shards.get(scope)
+        game_room = shard.game_rooms.get(room_id) if shard is not None else None
+        if game_room is not None:
+            game_room.spectators.pop(user_id, None)
+            self.save_room(shard, room_id)
+        return True
+    
+    @router.command("leave", aliases=("离开",), locked=True, requires=(InRoom(),))
+    async def leave_game(self, ctx: CommandContext):
+        """离开游戏房间"""
+        event, user_id, user_name = ctx.event, ctx.user_id, ctx.user_name
+        room_id, game_room = ctx.room_id, ctx.room
+        
+        # 从房间中移除玩家；游戏中离开时记下离开的是否为当前发言者
+        was_speaker = False
+        if game_room.status is RoomStatus.PLAYING:
+            self.log_event(game_room, EVENT_LEAVE, round=game_room.round, name=user_name)
+            index = game_room.current_speaker_index
+            was_speaker = index < len(game_room.speech_order) and game_room.speech_order[index].user_id == user_id
+        game_room.remove_player(user_id)
+        self.unbind_user(ctx.shard, user_id)
         
         # 如果是房主离开，重新分配房主
         if game_room.owner_id == user_id:
@@ -269,286 +881,788 @@ class UndercoverPlugin(Star):
                 new_owner = game_room.players[0]
                 game_room.owner_id = new_owner.user_id
                 game_room.owner_name = new_owner.user_name
-                async for r in self.notify_room(event, f"房主 {user_name} 已离开，新房主：{new_owner.user_name}"):
-                    yield r
+                self.notify_room(game_room, self.t("owner_left", name=user_name, new_owner=new_owner.user_name))
             else:
                 # 房间为空，删除房间
-                del self.game_rooms[room_id]
-                yield event.plain_result("你已离开游戏房间")
+                self.delete_room(ctx.shard, room_id)
+                yield event.plain_result(self.t("left_room"))
                 return
         else:
-            async for r in self.notify_room(event, f"玩家 {user_name} 已离开游戏"):
-                yield r
+            self.notify_room(game_room, self.t("player_left", name=user_name))
         
-        yield event.plain_result("你已离开游戏房间")
+        if game_room.status is RoomStatus.PLAYING:
+            self.continue_after_leave(game_room, was_speaker)
+        
+        yield event.plain_result(self.t("left_room"))
     
-    async def say(self, event: AstrMessageEvent, content: str):
+    @router.command("say", aliases=("发言",), locked=True, requires=(
+        InRoom(), HasStatus(RoomStatus.PLAYING, "game_not_started"), IsAlive("eliminated_cannot_speak")))
+    async def say(self, ctx: CommandContext):
         """游戏中发言"""
-        user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
+        event, user_id, game_room = ctx.event, ctx.user_id, ctx.room
         
-        if user_id not in self.user_rooms:
-            yield event.plain_result("你不在任何游戏房间中")
-            return
-        
-        room_id = self.user_rooms[user_id]
-        game_room = self.game_rooms[room_id]
-        
-        if game_room.status != "playing":
-            yield event.plain_result("游戏未开始")
+        if game_room.current_speaker_index >= len(game_room.speech_order):
+            yield event.plain_result(self.t("speech_over"))
             return
         
         # 检查是否是当前发言玩家
         current_player = game_room.speech_order[game_room.current_speaker_index]
         if current_player.user_id != user_id:
-            yield event.plain_result(f"当前不是你的发言轮次，现在是 {current_player.user_name} 发言")
-            return
-        
-        # 检查玩家是否存活
-        player = next(p for p in game_room.players if p.user_id == user_id)
-        if not player.is_alive:
-            yield event.plain_result("你已被淘汰，无法发言")
+            yield event.plain_result(self.t("not_your_turn", speaker=current_player.user_name))
             return
         
         # 广播发言内容
-        async for r in self.notify_room(event, f"{user_name}：{content}"):
-            yield r
+        self.notify_room(game_room, self.t("speech", name=ctx.user_name, text=ctx.text))
+        self.log_event(game_room, EVENT_SPEECH, round=game_room.round, name=ctx.user_name, text=ctx.text)
         
         # 切换到下一个发言玩家
-        game_room.current_speaker_index += 1
-        
-        # 检查是否所有人都已发言
-        if game_room.current_speaker_index >= len(game_room.speech_order):
-            # 发言结束，进入投票阶段
-            async for r in self.notify_room(event, "发言结束，开始投票！\n" 
-                                  "请使用 /undercover vote <玩家> 进行投票"):
-                yield r
-        else:
-            # 通知下一个发言玩家
-            next_player = game_room.speech_order[game_room.current_speaker_index]
-            async for r in self.notify_room(event, f"下一位发言玩家：{next_player.user_name}"):
-                yield r
+        self.advance_speaker(game_room)
     
-    async def vote(self, event: AstrMessageEvent, target_name: str):
+    @router.command("vote", aliases=("投票",), locked=True, requires=(
+        InRoom(), HasStatus(RoomStatus.PLAYING, "game_not_started"), IsAlive("eliminated_cannot_vote")))
+    async def vote(self, ctx: CommandContext):
         """游戏中投票"""
-        user_id = event.get_sender_id()
-        user_name = event.get_sender_name()
-        
-        if user_id not in self.user_rooms:
-            yield event.plain_result("你不在任何游戏房间中")
-            return
-        
-        room_id = self.user_rooms[user_id]
-        game_room = self.game_rooms[room_id]
-        
-        if game_room.status != "playing":
-            yield event.plain_result("游戏未开始")
-            return
+        event, user_id, game_room = ctx.event, ctx.user_id, ctx.room
+        target_name = ctx.text
         
         # 检查是否在投票阶段（所有人都已发言）
         if game_room.current_speaker_index < len(game_room.speech_order):
-            yield event.plain_result("当前仍在发言阶段，无法投票")
+            yield event.plain_result(self.t("still_speaking"))
             return
         
-        # 检查玩家是否存活
-        voter = next(p for p in game_room.players if p.user_id == user_id)
-        if not voter.is_alive:
-            yield event.plain_result("你已被淘汰，无法投票")
+        # 查找目标玩家：@提及 > 精确昵称 > 座位号 > 唯一前缀 > 模糊匹配
+        candidates = game_room.find_alive_players(target_name, self.get_mentioned_ids(event))
+        if not candidates:
+            yield event.plain_result(self.t("vote_target_not_found", target=target_name))
+            return
+        if len(candidates) > 1:
+            item = self.t.messages["roster_item"]
+            names = self.t.join_names(item.format(seat=p.seat, name=p.user_name)
+                                      for p in sorted(candidates, key=lambda p: p.seat))
+            yield event.plain_result(self.t("vote_target_ambiguous", names=names))
             return
+        target_player = candidates[0]
         
-        # 查找目标玩家
-        target_player = None
-        for p in game_room.players:
-            if p.is_alive and target_name in p.user_name:
-                target_player = p
-                break
+        # 记录投票
+        game_room.cast_vote(user_id, target_player.user_id)
+        self.notify_room(game_room, self.t("voted", voter=ctx.user_name, target=target_player.user_name))
+        self.log_event(game_room, EVENT_VOTE, round=game_room.round, voter=ctx.user_name, target=target_player.user_name)
         
-        if not target_player:
-            yield event.plain_result(f"未找到存活玩家：{target_name}")
+        # 所有存活玩家都已投票则结算
+        if game_room.all_voted():
+            self.resolve_votes(game_room)
+    
+    # 阶段流转
+    def continue_after_leave(self, game_room: GameRoom, was_speaker: bool):
+        """游戏中有玩家离开后推进对局
+
+        离开可能直接决出胜负；离开的是当前发言者时轮到下一位（或进入投票阶段）；
+        投票阶段中离开的是最后一位未投票的玩家时立即结算。
+        """
+        self.check_winner(game_room)
+        if game_room.status is not RoomStatus.PLAYING:
+            return
+        if game_room.current_speaker_index < len(game_room.speech_order):
+            if was_speaker:
+                next_player = game_room.speech_order[game_room.current_speaker_index]
+                self.notify_room(game_room, self.t("next_speaker", speaker=next_player.user_name))
+        elif was_speaker:
+            self.notify_room(game_room, self.t("vote_start"))
+        elif game_room.votes and game_room.all_voted():
+            self.resolve_votes(game_room)
             return
+        # 按新的发言顺序或投票人数重新计时
+        self.arm_phase_timer(game_room)
+    
+    def advance_speaker(self, game_room: GameRoom):
+        """切换到下一位发言玩家，所有人发言完毕后进入投票阶段"""
+        game_room.current_speaker_index += 1
         
-        # 记录投票
-        game_room.votes[user_id] = target_player.user_id
-        async for r in self.notify_room(event, f"{user_name} 投票给了 {target_player.user_name}"):
-            yield r
-        
-        # 检查是否所有人都已投票
-        alive_players = [p for p in game_room.players if p.is_alive]
-        if len(game_room.votes) >= len(alive_players):
-            # 统计投票结果
-            vote_counts = {}
-            for voted_id in game_room.votes.values():
-                vote_counts[voted_id] = vote_counts.get(voted_id, 0) + 1
+        # 检查是否所有人都已发言
+        if game_room.current_speaker_index >= len(game_room.speech_order):
+            # 发言结束，进入投票阶段
+            self.notify_room(game_room, self.t("vote_start"))
+        else:
+            # 通知下一个发言玩家
+            next_player = game_room.speech_order[game_room.current_speaker_index]
+            self.notify_room(game_room, self.t("next_speaker", speaker=next_player.user_name))
+        self.arm_phase_timer(game_room)
+    
+    def resolve_votes(self, game_room: GameRoom):
+        """结算本轮投票：唯一最高票出局，平票重新投票"""
+        # 得票在投票时已增量统计，直接取得票最高的玩家
+        eliminated_players = game_room.vote_leaders()
+        
+        if len(eliminated_players) == 1:
+            # 唯一得票最高者被淘汰
+            eliminated = eliminated_players[0]
+            game_room.eliminate(eliminated)
+            self.log_event(game_room, EVENT_ELIMINATE, round=game_room.round, name=eliminated.user_name,
+                           role=eliminated.role.value)
+            role = self.t.role_name(eliminated.role)
+            self.notify_room(game_room, self.t("vote_eliminated", name=eliminated.user_name, role=role, word=eliminated.word),
+                             self.t("spectator_eliminated", name=eliminated.user_name, role=role))
             
-            # 找出得票最高的玩家
-            max_votes = max(vote_counts.values())
-            eliminated_players = [p for p in alive_players if vote_counts.get(p.user_id, 0) == max_votes]
+            # 检查游戏是否结束
+            self.check_winner(game_room)
+            if game_room.status is RoomStatus.ENDED:
+                return
             
-            if len(eliminated_players) == 1:
-                # 唯一得票最高者被淘汰
-                eliminated = eliminated_players[0]
-                eliminated.is_alive = False
-                role_name = "卧底" if eliminated.role == "undercover" else "平民"
-                
-                result_msg = (f"🗳️ 投票结果：\n"
-                            f"玩家 {eliminated.user_name} 被票出局！\n"
-                            f"👤 身份：{role_name}\n"
-                            f"📝 词语：{eliminated.word}")
-                            
-                async for r in self.notify_room(event, result_msg):
-                    yield r
-                
-                # 检查游戏是否结束
-                async for r in self.check_winner(game_room, event):
-                    yield r
-                if game_room.status == "ended":
-                    return
-                
-                # 进入下一轮
-                game_room.round += 1
-                game_room.current_speaker_index = 0
-                game_room.votes.clear()
-                
-                # 更新发言顺序（只包含存活玩家）
-                game_room.speech_order = [p for p in game_room.players if p.is_alive]
-                random.shuffle(game_room.speech_order)
-                
-                current_player = game_room.speech_order[game_room.current_speaker_index]
-                async for r in self.notify_room(event, f"第 {game_room.round} 轮发言开始！\n" 
-                                      f"当前发言玩家：{current_player.user_name}"):
-                    yield r
+            self.start_next_round(game_room)
+        else:
+            # 平票，重新投票
+            names = self.t.messages["list_sep"].join(p.user_name for p in eliminated_players)
+            self.notify_room(game_room, self.t("vote_tie", names=names))
+            game_room.clear_votes()
+            self.arm_phase_timer(game_room)
+    
+    def start_next_round(self, game_room: GameRoom):
+        """进入下一轮发言"""
+        game_room.round += 1
+        game_room.current_speaker_index = 0
+        game_room.clear_votes()
+        
+        # 更新发言顺序（只包含存活玩家）
+        game_room.speech_order = game_room.alive_players()
+        game_room.rng_for(game_room.round).shuffle(game_room.speech_order)
+        
+        current_player = game_room.speech_order[game_room.current_speaker_index]
+        self.notify_room(game_room, self.t("round_started", round=game_room.round, speaker=current_player.user_name))
+        self.arm_phase_timer(game_room)
+    
+    def arm_phase_timer(self, game_room: GameRoom):
+        """为当前阶段（发言或投票）设置超时，替换该房间之前的阶段定时器"""
+        game_room.phase_seq += 1
+        key = ("phase",) + game_room.key
+        if game_room.status is not RoomStatus.PLAYING:
+            self.scheduler.cancel(key)
+            return
+        speaking = game_room.current_speaker_index < len(game_room.speech_order)
+        timeout = self.speech_timeout if speaking else self.vote_timeout
+        if not timeout:
+            self.scheduler.cancel(key)
+            return
+        scope, room_id, seq = game_room.scope, game_room.room_id, game_room.phase_seq
+        self.scheduler.schedule(key, timeout, lambda: self._on_phase_timeout(scope, room_id, seq))
+    
+    async def _on_phase_timeout(self, scope: str, room_id: str, seq: int):
+        """阶段超时：跳过当前发言者，或将未投票的玩家视为弃权后结算"""
+        shard = self.shards.get(scope)
+        if shard is None or room_id not in shard.game_rooms:
+            return
+        async with self.room_lock((scope, room_id)):
+            game_room = shard.game_rooms.get(room_id)
+            # 等锁期间阶段可能已被玩家操作推进，此时回调已过期
+            if game_room is None or game_room.phase_seq != seq or game_room.status is not RoomStatus.PLAYING:
+                return
+            if game_room.current_speaker_index < len(game_room.speech_order):
+                speaker = game_room.speech_order[game_room.current_speaker_index]
+                self.notify_room(game_room, self.t("speech_timeout", name=speaker.user_name))
+                self.advance_speaker(game_room)
+            elif not game_room.votes:
+                # 整轮无人投票，视为房间已无人参与，直接中止游戏
+                self.notify_room(game_room, self.t("vote_timeout_abort"))
+                self.finish_game(game_room)
             else:
-                # 平票，重新投票
-                async for r in self.notify_room(event, f"投票结果平票：{', '.join(p.user_name for p in eliminated_players)}\n" 
-                                      "重新投票！"):
-                    yield r
-                game_room.votes.clear()
+                abstainers = [p.user_name for p in game_room.alive_players() if p.user_id not in game_room.votes]
+                self.notify_room(game_room, self.t("vote_timeout_abstain", names=self.t.join_names(abstainers)))
+                self.resolve_votes(game_room)
+            self.save_room(shard, room_id)
+        self.broadcaster.flush()
     
-    async def check_winner(self, game_room: GameRoom, event: AstrMessageEvent):
+    def check_winner(self, game_room: GameRoom):
         """检查游戏是否结束"""
-        alive_players = [p for p in game_room.players if p.is_alive]
-        alive_citizens = [p for p in alive_players if p.role == "citizen"]
-        alive_undercovers = [p for p in alive_players if p.role == "undercover"]
+        alive_citizens = game_room.count_alive(Role.CITIZEN)
+        alive_undercovers = game_room.count_alive(Role.UNDERCOVER)
         
         winner = None
-        if len(alive_undercovers) == 0:
-            winner = "平民"
-        elif len(alive_undercovers) >= len(alive_citizens):
-            winner = "卧底"
+        if alive_undercovers == 0:
+            winner = Role.CITIZEN
+        elif alive_undercovers >= alive_citizens:
+            winner = Role.UNDERCOVER
             
         if winner:
             # 构建全员身份列表
-            player_list_str = "\n".join([
-                f"{p.user_name}：{'卧底' if p.role == 'undercover' else '平民'} - {p.word}"
-                for p in game_room.players
-            ])
+            item = self.t.messages["reveal_item"]
+            reveal = "\n".join(item.format(name=p.user_name, role=self.t.role_name(p.role), word=p.word)
+                               for p in game_room.players)
             
-            msg = f"游戏结束！\n{winner}胜利！\n\n全员身份公示：\n{player_list_str}"
-            
-            async for r in self.notify_room(event, msg):
-                yield r
-            game_room.status = "ended"
+            message = self.t("game_over", winner=self.t.role_name(winner), reveal=reveal)
+            if self.game_log is not None:
+                message += "\n\n" + self.t("replay_hint", game_id=game_room.game_id)
+            self.notify_room(game_room, message, self.t("spectator_game_over", winner=self.t.role_name(winner)))
+            self.record_game(game_room, winner)
+            self.finish_game(game_room, winner)
+    
+    def record_game(self, game_room: GameRoom, winner: Role):
+        """将一局的结果计入本会话的排行榜，并登记到战绩存储"""
+        leaderboard = self.get_leaderboard(game_room.scope)
+        for player in game_room.players:
+            won, undercover = player.role is winner, player.role is Role.UNDERCOVER
+            leaderboard.apply(player.user_id, player.user_name, won, undercover)
+            self.stats_store.stage(game_room.scope, player.user_id, player.user_name, won, undercover)
     
-    async def end_game(self, event: AstrMessageEvent):
+    def finish_game(self, game_room: GameRoom, winner: Role = None):
+        """将房间标记为已结束并立即释放其中的玩家，winner 为空表示中止"""
+        self.log_event(game_room, EVENT_END, winner=winner.value if winner else None)
+        self.set_room_status(game_room, RoomStatus.ENDED)
+        self.scheduler.cancel(("phase",) + game_room.key)
+        # 玩家可以马上创建、加入房间或匹配，不必等已结束的房间被回收；观战随之解散
+        shard = self.get_shard(game_room.scope)
+        for player in game_room.players:
+            if shard.user_rooms.get(player.user_id) == game_room.room_id:
+                self.unbind_user(shard, player.user_id)
+        self.release_spectators(game_room)
+        # 已结束的房间使用更短的超时，到期后回收
+        self.schedule_room_gc(game_room)
+    
+    @router.command("end", aliases=("结束",), locked=True, requires=(InRoom(), IsOwner("owner_only_end")))
+    async def end_game(self, ctx: CommandContext):
         """结束游戏"""
-        user_id = event.get_sender_id()
-        
-        if user_id not in self.user_rooms:
-            yield event.plain_result("你不在任何游戏房间中")
-            return
-        
-        room_id = self.user_rooms[user_id]
-        game_room = self.game_rooms[room_id]
-        
-        if game_room.owner_id != user_id:
-            yield event.plain_result("只有房主可以结束游戏")
-            return
-        
+        if ctx.room.status is RoomStatus.PLAYING:
+            self.log_event(ctx.room, EVENT_END, winner=None)
         # 通知所有玩家游戏结束
-        async for r in self.notify_room(event, "游戏已结束"):
-            yield r
+        self.notify_room(ctx.room, self.t("game_ended"))
         
         # 清理房间数据
-        for player in game_room.players:
-            if player.user_id in self.user_rooms:
-                del self.user_rooms[player.user_id]
-        
-        del self.game_rooms[room_id]
-        yield event.plain_result("游戏已结束")
+        self.delete_room(ctx.shard, ctx.room_id)
     
-    async def add_word_pair(self, event: AstrMessageEvent, word1: str, word2: str):
+    @router.command("add", aliases=("添加",))
+    async def add_word_pair(self, ctx: CommandContext):
         """添加词语对"""
+        event, word1, word2 = ctx.event, ctx.arg(0), ctx.arg(1)
         if not word1 or not word2:
-            yield event.plain_result("请输入两个词语，格式：/undercover add <词语1> <词语2>")
+            yield event.plain_result(self.t("add_usage"))
             return
         
-        # 添加到词语库
-        if [word1, word2] not in self.word_pairs and [word2, word1] not in self.word_pairs:
-            self.word_pairs.append([word1, word2])
-            self.save_word_pairs(self.word_pairs)
-            yield event.plain_result(f"词语对添加成功：{word1} - {word2}")
-        else:
-            yield event.plain_result("该词语对已存在")
+        word_pairs = await self.ensure_word_pairs(indexed=True)
+        async with self._similarity_lock:
+            if (word1, word2) in word_pairs:
+                yield event.plain_result(self.t("word_pair_exists"))
+                return
+            
+            # 过于相似、差别过大或与已有词语对过于接近的词语对不入库；大词库下矩阵运算需数毫秒，放到线程中
+            verdict = await asyncio.to_thread(self.similarity.check, word1, word2)
+            if verdict is not None:
+                reason, score, index = verdict
+                similar = word_pairs[index] if index is not None else ("", "")
+                yield event.plain_result(self.t(f"word_pair_{reason}", score=score, word1=similar[0], word2=similar[1]))
+                return
+            
+            # 添加到词语库，可选的第三、四个参数为分类和难度
+            word_pairs.add(word1, word2, make_tag(ctx.arg(2), ctx.arg(3)))
+            await asyncio.to_thread(self.similarity.add, word1, word2)
+        await self.append_word_pair(word_pairs.entry(len(word_pairs) - 1))
+        yield event.plain_result(self.t("word_pair_added", word1=word1, word2=word2))
     
-    async def list_games(self, event: AstrMessageEvent):
-        """查看游戏列表"""
-        if not self.game_rooms:
-            yield event.plain_result("当前没有游戏房间")
+    @router.command("import", aliases=("导入",), requires=(IsAdmin(),))
+    async def import_word_pairs(self, ctx: CommandContext):
+        """从 CSV 或 JSON 文件批量导入词语对（管理员）"""
+        event, path = ctx.event, ctx.text
+        if not path:
+            yield event.plain_result(self.t("import_usage"))
             return
         
-        game_list = "当前游戏房间列表：\n"
-        for room_id, game_room in self.game_rooms.items():
-            game_list += f"房间号：{room_id} | 状态：{game_room.status} | 玩家数：{len(game_room.players)}\n"
+        try:
+            entries = await asyncio.to_thread(read_pairs_file, path)
+        except (OSError, ValueError) as e:
+            yield event.plain_result(self.t("import_failed", error=e))
+            return
+        
+        # 跳过格式错误和已存在的条目，其余在线程中做相似度检查
+        word_pairs = await self.ensure_word_pairs(indexed=True)
+        async with self._similarity_lock:
+            parsed = [entry for entry in map(parse_entry, entries) if entry is not None and entry[:2] not in word_pairs]
+            accepted, vectors = await asyncio.to_thread(self.similarity.vet, [entry[:2] for entry in parsed])
+            
+            # 批量导入直接写快照，不逐条追加日志
+            added = [word_pairs.add(*parsed[i]) for i in accepted]
+            if vectors is not None:
+                await asyncio.to_thread(self.similarity.extend, vectors[:, added])
+        if any(added):
+            await self.compact_word_pairs()
+        yield event.plain_result(self.t("import_done", added=sum(added), skipped=len(entries) - sum(added),
+                                        rejected=len(parsed) - len(accepted)))
+    
+    @router.command("replay", aliases=("回放",))
+    async def replay_game(self, ctx: CommandContext):
+        """回放已结束的对局"""
+        event, game_id, t = ctx.event, ctx.arg(0), self.t
+        if not game_id:
+            yield event.plain_result(t("replay_usage"))
+            return
+        if self.game_log is None:
+            yield event.plain_result(t("replay_disabled"))
+            return
         
-        yield event.plain_result(game_list)
+        # 先写出缓冲区中的事件，再在线程中扫描分段文件
+        await self.flush_state()
+        events = await asyncio.to_thread(self.game_log.read_game, game_id)
+        # 只回放已结束的对局，避免泄露进行中对局的词语
+        if not events or events[0][0] != EVENT_START or events[-1][0] != EVENT_END:
+            yield event.plain_result(t("replay_not_found", game_id=game_id))
+            return
+        yield event.plain_result(self.render_replay(game_id, events))
+    
+    def render_replay(self, game_id: str, events: list) -> str:
+        """将对局事件渲染为回放文本"""
+        t = self.t
+        lines = []
+        for kind, stamp, data in events:
+            if kind == EVENT_START:
+                started = time.strftime("%Y-%m-%d %H:%M", time.localtime(stamp))
+                lines.append(t("replay_header", game_id=game_id, room_id=data["room"], time=started))
+                lines.append(t("replay_words", citizen=data["words"][0], undercover=data["words"][1]))
+                for seat, name, role, word in data["players"]:
+                    lines.append(t("replay_player", seat=seat, name=name, role=t.role_name(Role(role)), word=word))
+            elif kind == EVENT_SPEECH:
+                lines.append(t("replay_speech", round=data["round"], name=data["name"], text=data["text"]))
+            elif kind == EVENT_VOTE:
+                lines.append(t("replay_vote", round=data["round"], voter=data["voter"], target=data["target"]))
+            elif kind == EVENT_ELIMINATE:
+                lines.append(t("replay_eliminate", round=data["round"], name=data["name"],
+                               role=t.role_name(Role(data["role"]))))
+            elif kind == EVENT_LEAVE:
+                lines.append(t("replay_leave", round=data["round"], name=data["name"]))
+            elif kind == EVENT_END:
+                winner = data.get("winner")
+                lines.append(t("replay_winner", winner=t.role_name(Role(winner))) if winner else t("replay_aborted"))
+        return "\n".join(lines)
+    
+    @router.command("list", aliases=("列表",))
+    async def list_games(self, ctx: CommandContext):
+        """查看游戏列表，支持分页和按状态筛选"""
+        event = ctx.event
+        page, status = 1, None
+        for arg in ctx.args:
+            if arg.isdecimal():
+                page = int(arg)
+            elif arg.lower() in ROOM_STATUS_FILTERS:
+                status = ROOM_STATUS_FILTERS[arg.lower()]
+            else:
+                yield event.plain_result(self.t("list_usage"))
+                return
+        yield event.plain_result(ctx.shard.render_room_list(self.t, page, status, self.list_page_size))
     
-    async def get_word(self, event: AstrMessageEvent):
+    @router.command("rank", aliases=("排行",))
+    async def show_rank(self, ctx: CommandContext):
+        """查看本群排行榜"""
+        event, t = ctx.event, self.t
+        count = int(ctx.arg(0)) if ctx.arg(0).isdecimal() else 10
+        count = max(1, min(count, 50))
+        leaderboard = self.leaderboards.get(ctx.shard.scope)
+        if not leaderboard:
+            yield event.plain_result(t("rank_empty"))
+            return
+        lines = [t("rank_header", count=min(count, len(leaderboard)), total=len(leaderboard))]
+        for rank, record in enumerate(leaderboard.top(count), 1):
+            lines.append(t("rank_item", rank=rank, name=record.name, wins=record.wins,
+                           games=record.games, rate=record.win_rate))
+        yield event.plain_result("\n".join(lines))
+    
+    @router.command("stats", aliases=("统计",))
+    async def show_stats(self, ctx: CommandContext):
+        """查看玩家战绩；不带参数时查看插件运行指标（管理员）"""
+        if ctx.args:
+            yield ctx.event.plain_result(self.render_player_stats(ctx))
+            return
+        if not IsAdmin().check(self, ctx):
+            yield ctx.event.plain_result(self.t(IsAdmin.message))
+            return
+        t = self.t
+        gauges = self.collect_gauges()
+        lines = [
+            t("stats_header"),
+            t("stats_rooms", **gauges["rooms"]),
+            t("stats_players", players=gauges["players"]),
+            t("stats_queued", queued=gauges["queued"]),
+            t("stats_spectators", spectators=gauges["spectators"]),
+            t("stats_word_pairs", word_pairs=gauges["word_pairs"]) if self.word_pairs_state == "ready"
+            else t("stats_word_pairs_loading"),
+            t("stats_messages", sent=gauges["messages_sent"], dropped=gauges["messages_dropped"]),
+            t("stats_evicted", evicted=gauges["rooms_evicted"], reclaimed=gauges["bytes_reclaimed"]),
+            t("stats_commands", sample_every=self.metrics.sample_every),
+        ]
+        for name, count in sorted(self.metrics.commands.items(), key=lambda item: -item[1]):
+            histogram = self.metrics.latency.get(name)
+            if histogram is not None:
+                lines.append(t("stats_command_timed", name=name, count=count,
+                               p50=histogram.quantile(0.5), p99=histogram.quantile(0.99)))
+            else:
+                lines.append(t("stats_command", name=name, count=count))
+        yield ctx.event.plain_result("\n".join(lines))
+    
+    @router.command("word", aliases=("词语",), requires=(
+        InAnyRoom(prefer=RoomStatus.PLAYING), HasStatus(RoomStatus.PLAYING, "game_not_started"), IsAlive("eliminated")))
+    async def get_word(self, ctx: CommandContext):
         """获取自己的词语（建议私聊使用）"""
+        event, player = ctx.event, ctx.player
+        yield event.plain_result(self.t("your_word", word=player.word))
+    
+    def render_player_stats(self, ctx: CommandContext) -> str:
+        """按 @提及、user_id 或昵称查找本群的玩家战绩"""
+        t, target = self.t, ctx.text
+        leaderboard = self.leaderboards.get(ctx.shard.scope)
+        record = None
+        if leaderboard:
+            mentioned = self.get_mentioned_ids(ctx.event)
+            record = leaderboard.get(mentioned[0]) if mentioned else leaderboard.find(target.lstrip("@"))
+        if record is None:
+            return t("player_stats_not_found", target=target)
+        return t("player_stats", name=record.name, rank=leaderboard.rank(record), total=len(leaderboard),
+                 games=record.games, wins=record.wins, rate=record.win_rate,
+                 undercover_games=record.undercover_games, undercover_wins=record.undercover_wins,
+                 citizen_games=record.citizen_games, citizen_wins=record.citizen_wins)
+    
+    # 辅助函数
+    def get_leaderboard(self, scope: str) -> Leaderboard:
+        leaderboard = self.leaderboards.get(scope)
+        if leaderboard is None:
+            leaderboard = self.leaderboards[scope] = Leaderboard()
+        return leaderboard
+    
+    def get_shard(self, scope: str) -> RoomShard:
+        """获取会话的房间状态，会话还没有房间时返回一个未登记的空分片"""
+        shard = self.shards.get(scope)
+        return shard if shard is not None else RoomShard(scope)
+    
+    def register_shard(self, shard) -> RoomShard:
+        """登记分片（或会话），已登记时返回现有的分片"""
+        if isinstance(shard, str):
+            shard = RoomShard(shard)
+        return self.shards.setdefault(shard.scope, shard)
+    
+    def bind_user(self, shard: RoomShard, user_id, room_id: str):
+        """记录用户在该会话中所在的房间（同时退出匹配队列和对该房间的观战）"""
+        shard.user_rooms[user_id] = room_id
+        if shard.queue.pop(user_id, None) is not None:
+            # 离开的可能是队首，按新的队首重新计时
+            self.arm_queue_timer(shard)
+        if self.spectating.get(user_id) == (shard.scope, room_id):
+            self.stop_watching(user_id)
+        self.user_scopes.setdefault(user_id, {})[shard.scope] = None
+        shard.invalidate()
+    
+    def unbind_user(self, shard: RoomShard, user_id):
+        """释放用户在该会话中的房间记录"""
+        shard.user_rooms.pop(user_id, None)
+        scopes = self.user_scopes.get(user_id)
+        if scopes is not None:
+            scopes.pop(shard.scope, None)
+            if not scopes:
+                del self.user_scopes[user_id]
+        shard.invalidate()
+    
+    def get_recent_pairs(self, shard: RoomShard) -> RecentRing:
+        """获取会话最近抽到的词语对记录"""
+        if shard.recent_pairs is None:
+            shard.recent_pairs = RecentRing(self.recent_pairs_size)
+        return shard.recent_pairs
+    
+    def parse_lexicon_filters(self, word_pairs: WordPairStore, args: list) -> tuple:
+        """解析 start 的参数：词语库中已有的难度名视为难度，其余视为分类"""
+        category = difficulty = None
+        difficulties = word_pairs.difficulties()
+        for arg in args:
+            if arg in difficulties:
+                difficulty = arg
+            else:
+                category = arg
+        return category, difficulty
+    
+    def set_room_status(self, game_room: GameRoom, status: RoomStatus):
+        """切换房间状态并更新所在分片的状态索引，房间状态只应通过此方法修改"""
+        self.shards[game_room.scope].set_room_status(game_room, status)
+    
+    def room_lock(self, key: tuple) -> asyncio.Lock:
+        """获取房间锁，key 为 (会话, 房间号)，不同房间的指令互不阻塞"""
+        lock = self._room_locks.get(key)
+        if lock is None:
+            lock = self._room_locks[key] = asyncio.Lock()
+        return lock
+    
+    async def run_in_room(self, event: AstrMessageEvent, handler, shard: RoomShard, room_id: str = None):
+        """在房间锁内执行处理函数
+
+        room_id 为空时使用发送者在该会话中所在的房间。处理函数的输出先缓冲，
+        释放锁后再逐条发出，避免在状态修改中途让出事件循环。
+        处理过程中通过 notify_room 登记的广播也在此时一并推送。
+        """
         user_id = event.get_sender_id()
         
-        if user_id not in self.user_rooms:
-            yield event.plain_result("你不在任何游戏房间中")
-            return
+        def resolve_room():
+            rid = room_id if room_id is not None else shard.user_rooms.get(user_id)
+            return rid if rid in shard.game_rooms else None
         
-        room_id = self.user_rooms[user_id]
-        game_room = self.game_rooms[room_id]
+        while True:
+            locked_id = resolve_room()
+            if locked_id is None:
+                results = [r async for r in handler]
+                break
+            async with self.room_lock((shard.scope, locked_id)):
+                # 等锁期间玩家可能已离开或房间已被删除，需重新确认
+                if resolve_room() != locked_id:
+                    continue
+                results = [r async for r in handler]
+                self.save_room(shard, locked_id)
+                break
         
-        if game_room.status != "playing":
-            yield event.plain_result("游戏未开始")
+        # 本次指令产生的房间广播合并后推送
+        self.broadcaster.flush()
+        for result in results:
+            yield result
+    
+    def delete_room(self, shard: RoomShard, room_id: str):
+        """删除房间并释放其中的玩家"""
+        game_room = shard.pop_room(room_id)
+        if game_room is None:
+            return None
+        for player in game_room.players:
+            if shard.user_rooms.get(player.user_id) == room_id:
+                self.unbind_user(shard, player.user_id)
+        self.release_spectators(game_room)
+        self.scheduler.cancel(("gc",) + game_room.key)
+        self.scheduler.cancel(("phase",) + game_room.key)
+        self._room_locks.pop(game_room.key, None)
+        return game_room
+    
+    def release_spectators(self, game_room: GameRoom):
+        """解散房间的观战，对局编号不再指向该房间"""
+        for user_id in game_room.spectators:
+            if self.spectating.get(user_id) == game_room.key:
+                del self.spectating[user_id]
+        game_room.spectators.clear()
+        if self.rooms_by_game.get(game_room.game_id) is game_room:
+            del self.rooms_by_game[game_room.game_id]
+    
+    def schedule_room_gc(self, game_room: GameRoom):
+        """按房间当前状态的超时时间安排回收检查"""
+        ttl = self.room_ttls[game_room.status]
+        delay = game_room.last_active + ttl - time.time()
+        self.scheduler.schedule(("gc",) + game_room.key, delay,
+                                lambda: self._expire_room(game_room.scope, game_room.room_id))
+    
+    async def _expire_room(self, scope: str, room_id: str):
+        """回收检查：空闲超时则删除房间，否则按剩余时间重新安排"""
+        shard = self.shards.get(scope)
+        if shard is None or room_id not in shard.game_rooms:
             return
-        
-        # 查找玩家
-        player = next((p for p in game_room.players if p.user_id == user_id), None)
-        if not player:
-            yield event.plain_result("未找到玩家信息")
+        async with self.room_lock((scope, room_id)):
+            self._expire_room_locked(shard, room_id)
+    
+    def _expire_room_locked(self, shard: RoomShard, room_id: str):
+        game_room = shard.game_rooms.get(room_id)
+        if game_room is None:
             return
-            
-        if not player.is_alive:
-            yield event.plain_result("你已被淘汰")
+        # 活动时间只在操作时刷新，不重排定时器；到期后在这里惰性判断
+        if time.time() - game_room.last_active < self.room_ttls[game_room.status]:
+            self.schedule_room_gc(game_room)
             return
-            
-        yield event.plain_result(f"你的词语是：{player.word}\n(请确保你在私聊中查看此消息)")
+        size = game_room.estimate_size()
+        self.delete_room(shard, room_id)
+        self.save_room(shard, room_id)
+        self.gc_stats["rooms_evicted"] += 1
+        self.gc_stats["bytes_reclaimed"] += size
+        logger.info(f"回收空闲房间 {room_id}（状态：{game_room.status.value}，玩家数：{len(game_room.players)}）")
     
-    # 辅助函数
-    async def notify_room(self, event: AstrMessageEvent, message: str):
-        """通知房间内所有玩家"""
-        yield event.plain_result(message)
+    def save_room(self, shard: RoomShard, room_id: str):
+        """登记房间的最新状态（房间已删除时登记删除），稍后批量写入存储"""
+        game_room = shard.game_rooms.get(room_id)
+        if game_room is not None:
+            self.state_store.stage_room(shard.storage_key(room_id), game_room.to_dict())
+        else:
+            self.state_store.stage_delete(shard.storage_key(room_id))
+        if self.scheduler.deadline(("flush_state",)) is None:
+            self.scheduler.schedule(("flush_state",), self.state_flush_interval, self.flush_state)
+    
+    async def flush_state(self):
+        """将登记的房间状态、战绩和对局日志批量写入存储"""
+        try:
+            await self.state_store.flush()
+        except Exception as e:
+            logger.error(f"保存房间状态失败：{e}")
+        try:
+            await self.stats_store.flush()
+        except Exception as e:
+            logger.error(f"保存玩家战绩失败：{e}")
+        if self.game_log is not None:
+            try:
+                await self.game_log.flush()
+            except OSError as e:
+                logger.error(f"写入对局日志失败：{e}")
+    
+    def collect_gauges(self) -> dict:
+        """计算当前的仪表数值"""
+        return {
+            "shards": len(self.shards),
+            "rooms": {status.value: sum(len(shard.rooms_by_status[status]) for shard in self.shards.values())
+                      for status in RoomStatus},
+            "players": sum(len(shard.user_rooms) for shard in self.shards.values()),
+            "word_pairs": len(self.word_pairs) if self.word_pairs is not None else 0,
+            "word_pairs_state": {state: int(state == self.word_pairs_state) for state in WORD_PAIRS_STATES},
+            "messages_sent": self.broadcaster.sent_count,
+            "messages_dropped": self.broadcaster.dropped_count,
+            "queued": sum(len(shard.queue) for shard in self.shards.values()),
+            "spectators": len(self.spectating),
+            "rooms_evicted": self.gc_stats["rooms_evicted"],
+            "bytes_reclaimed": self.gc_stats["bytes_reclaimed"],
+            "timers": len(self.scheduler),
+        }
     
-    def load_word_pairs(self) -> list:
-        """加载词语库"""
-        if os.path.exists(self.word_pairs_file):
+    async def dump_metrics(self):
+        """定时导出指标并预约下一次导出"""
+        self.scheduler.schedule(("metrics_dump",), self.metrics_interval, self.dump_metrics)
+        await self.write_metrics()
+    
+    async def write_metrics(self):
+        try:
+            await asyncio.to_thread(self.metrics.dump, self.metrics_file, self.collect_gauges())
+        except OSError as e:
+            logger.error(f"写入指标文件失败：{e}")
+    
+    async def restore_rooms(self):
+        """从存储中恢复各会话的房间、玩家所在房间和房间号计数器"""
+        rooms, meta = await self.state_store.load()
+        for key, value in meta.items():
+            if key.startswith("room_counter/"):
+                self.register_shard(key[len("room_counter/"):]).room_counter = value
+            elif key.startswith("recent_pairs/"):
+                shard = self.register_shard(key[len("recent_pairs/"):])
+                shard.recent_pairs = RecentRing(self.recent_pairs_size, value)
+        restored = 0
+        for data in rooms:
             try:
-                with open(self.word_pairs_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return self.get_default_word_pairs()
+                game_room = GameRoom.from_dict(data)
+            except (KeyError, ValueError, TypeError) as e:
+                logger.warning(f"房间存档格式错误，已跳过：{e}")
+                continue
+            room_id = game_room.room_id
+            legacy = "scope" not in data
+            if legacy:
+                # 旧版存档没有会话信息，归入房主加入房间时所在的会话
+                owner = game_room.get_player(game_room.owner_id)
+                game_room.scope = owner.session if owner is not None and owner.session else ""
+            shard = self.register_shard(game_room.scope)
+            shard.add_room(game_room)
+            # 已结束房间的玩家在结束时已释放
+            if game_room.status is not RoomStatus.ENDED:
+                for player in game_room.players:
+                    self.bind_user(shard, player.user_id, room_id)
+            if legacy:
+                self.state_store.stage_delete(room_id)
+                self.save_room(shard, room_id)
+            if game_room.game_id and game_room.status is not RoomStatus.ENDED:
+                self.rooms_by_game[game_room.game_id] = game_room
+            for user_id in game_room.spectators:
+                self.spectating[user_id] = game_room.key
+            self.schedule_room_gc(game_room)
+            self.arm_phase_timer(game_room)
+            if room_id.isdecimal():
+                shard.room_counter = max(shard.room_counter, int(room_id) + 1)
+            restored += 1
+        if restored:
+            logger.info(f"已恢复 {restored} 个游戏房间")
+    
+    async def restore_stats(self):
+        """从存储中载入各会话的玩家战绩，重建排行榜"""
+        records = await self.stats_store.load()
+        for scope, record in records:
+            self.get_leaderboard(scope).load(record)
+        if records:
+            logger.info(f"已载入 {len(records)} 条玩家战绩")
+    
+    def get_mentioned_ids(self, event: AstrMessageEvent) -> list:
+        """提取消息中 @ 提及的用户 ID"""
+        message_obj = getattr(event, "message_obj", None)
+        return [str(comp.qq) for comp in getattr(message_obj, "message", None) or [] if isinstance(comp, At)]
+    
+    def log_event(self, game_room: GameRoom, event: int, **payload):
+        """记录一条对局事件（只写入缓冲区，随房间状态一起写出）"""
+        if self.game_log is not None and game_room.game_id:
+            self.game_log.append(game_room.game_id, event, payload)
+    
+    def notify_room(self, game_room: GameRoom, message: str, spectator_message: str = None):
+        """通知房间内所有玩家和观战者
+
+        消息只渲染一次，先进入广播缓冲区，同一次操作产生的多条消息在指令处理完后
+        按会话合并发送，同一会话中的多名玩家或观战者只收到一份。
+        含有词语的消息通过 spectator_message 为观战者提供不含词语的版本。
+        """
+        sessions = {p.session for p in game_room.players}
+        self.broadcaster.post(sessions, message)
+        if game_room.spectators:
+            watching = set(game_room.spectators.values())
+            watching.difference_update(sessions)
+            self.broadcaster.post(watching, spectator_message or message)
+    
+    def _start_loading_word_pairs(self):
+        if self._word_pairs_task is None:
+            self.word_pairs_state = "loading"
+            self._word_pairs_task = asyncio.create_task(self._load_word_pairs_in_background())
+    
+    async def _load_word_pairs_in_background(self):
+        """后台加载词语库：先读出列表供抽取使用，再在线程中构建判重索引"""
+        try:
+            store = await asyncio.to_thread(self.load_word_pairs)
+        except Exception as e:
+            logger.error(f"加载词语库失败，使用默认词语库：{e}")
+            store = WordPairStore(self.get_default_word_pairs())
+        self.word_pairs = store
+        self.word_pairs_state = "ready"
+        self._word_pairs_ready.set()
+        logger.info(f"词语库加载完成，共 {len(store)} 组词语")
+        await asyncio.to_thread(store.build_index)
+        await asyncio.to_thread(self.build_similarity_index, store)
+    
+    async def ensure_word_pairs(self, indexed: bool = False) -> WordPairStore:
+        """获取词语库，尚未加载时触发加载并等待
+
+        indexed 为 True 时额外等待判重索引构建完成（添加词语对前需要）。
+        """
+        self._start_loading_word_pairs()
+        if indexed:
+            await asyncio.shield(self._word_pairs_task)
         else:
-            return self.get_default_word_pairs()
+            await self._word_pairs_ready.wait()
+        return self.word_pairs
+    
+    def build_similarity_index(self, store: WordPairStore):
+        """读取词向量表并为整个词库构建相似度矩阵（阻塞，应在线程中调用）"""
+        try:
+            if self.similarity.load_vectors():
+                logger.info(f"已加载词向量表 {self.similarity.vectors_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"加载词向量表失败：{e}")
+        if not self.similarity.available:
+            logger.info("未安装 numpy，添加词语对时不检查与已有词语对的相似度")
+        self.similarity.rebuild(store)
+    
+    def load_word_pairs(self) -> WordPairStore:
+        """加载词语库（快照 + 回放追加日志），并预先构建不限条件的抽样器，阻塞 I/O"""
+        store = self.word_pairs_io.load(self.get_default_word_pairs())
+        store.prepare_sampler()
+        return store
+    
+    async def append_word_pair(self, entry):
+        """将新词语对记录追加到日志，日志过长时在后台压缩进快照"""
+        try:
+            async with self._word_pairs_lock:
+                await asyncio.to_thread(self.word_pairs_io.append, entry)
+        except OSError as e:
+            logger.error(f"写入词语库日志失败：{e}")
+            return
+        if (self.word_pairs_io.journal_size >= self.word_pairs_compact_threshold
+                and (self._compact_task is None or self._compact_task.done())):
+            self._compact_task = asyncio.create_task(self.compact_word_pairs())
     
-    def save_word_pairs(self, word_pairs: list):
-        """保存词语库"""
-        with open(self.word_pairs_file, 'w', encoding='utf-8') as f:
-            json.dump(word_pairs, f, ensure_ascii=False, indent=2)
+    async def compact_word_pairs(self):
+        """将追加日志压缩进快照"""
+        try:
+            async with self._word_pairs_lock:
+                snapshot = self.word_pairs.to_list()
+                await asyncio.to_thread(self.word_pairs_io.write_snapshot, snapshot)
+        except OSError as e:
+            logger.error(f"压缩词语库失败：{e}")
     
     def get_default_word_pairs(self) -> list:
         """获取默认词语库"""
@@ -572,4 +1686,18 @@ class UndercoverPlugin(Star):
     
     async def terminate(self):
         """插件销毁时调用"""
+        await self.scheduler.stop()
+        if self.metrics_file and self.metrics_interval > 0:
+            await self.write_metrics()
+        await self.broadcaster.stop()
+        await self.state_store.close()
+        await self.stats_store.close()
+        if self.game_log is not None:
+            await self.game_log.flush()
+        if self._word_pairs_task is not None:
+            await self._word_pairs_task
+        if self._compact_task is not None:
+            await self._compact_task
+        if self.word_pairs_io.journal_size:
+            await self.compact_word_pairs()
         logger.info("谁是卧底插件已卸载")
@@ -0,0 +1,119 @@
+import bisect
+import json
+import os
+import time
+
+
+class Histogram:
+    """固定分桶的延迟直方图（微秒），observe 为 O(log 桶数)"""
+    BOUNDS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.total = 0.0  # 耗时总和（微秒）
+
+    def observe(self, value_us: float):
+        self.buckets[bisect.bisect_left(self.BOUNDS, value_us)] += 1
+        self.count += 1
+        self.total += value_us
+
+    def quantile(self, q: float) -> float:
+        """按分桶上界估算分位数，落在 +Inf 桶时返回最大的有限上界"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.BOUNDS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return float(bound)
+        return float(self.BOUNDS[-1])
+
+
+class Metrics:
+    """插件运行指标
+
+    每个子指令一个调用计数器和一个延迟直方图。计时按 sample_every 抽样：
+    每 sample_every 次调用只有一次读取 time.perf_counter_ns，其余调用只做计数，
+    常开的开销可以忽略。仪表（房间数、玩家数等）在导出时由插件现场计算。
+    """
+
+    def __init__(self, sample_every: int = 4):
+        self.sample_every = max(1, int(sample_every))
+        self.started = time.time()
+        self.commands = {}  # 子指令名: 调用次数
+        self.latency = {}  # 子指令名: Histogram（仅抽样的调用）
+
+    def begin(self, name: str) -> int:
+        """登记一次调用，被抽中时返回开始时间（纳秒），否则返回 0"""
+        count = self.commands.get(name, 0) + 1
+        self.commands[name] = count
+        if count % self.sample_every:
+            return 0
+        return time.perf_counter_ns()
+
+    def end(self, name: str, start: int):
+        if start:
+            histogram = self.latency.get(name)
+            if histogram is None:
+                histogram = self.latency[name] = Histogram()
+            histogram.observe((time.perf_counter_ns() - start) / 1000)
+
+    def snapshot(self, gauges: dict) -> dict:
+        """导出全部指标，gauges 为 名称: 数值 或 名称: {标签值: 数值}"""
+        return {
+            "uptime_seconds": round(time.time() - self.started, 3),
+            "sample_every": self.sample_every,
+            "commands": dict(self.commands),
+            "latency_us": {
+                name: {
+                    "count": h.count,
+                    "sum": round(h.total, 3),
+                    "p50": h.quantile(0.5),
+                    "p99": h.quantile(0.99),
+                    "buckets": dict(zip([str(b) for b in Histogram.BOUNDS] + ["+Inf"], h.buckets)),
+                }
+                for name, h in self.latency.items()
+            },
+            "gauges": gauges,
+        }
+
+    def to_prometheus(self, gauges: dict) -> str:
+        """Prometheus 文本格式"""
+        lines = [
+            "# TYPE undercover_uptime_seconds gauge",
+            f"undercover_uptime_seconds {time.time() - self.started:.3f}",
+            "# TYPE undercover_commands_total counter",
+        ]
+        for name, count in self.commands.items():
+            lines.append(f'undercover_commands_total{{command="{name}"}} {count}')
+        lines.append("# TYPE undercover_command_latency_us histogram")
+        for name, h in self.latency.items():
+            cumulative = 0
+            for bound, n in zip([str(b) for b in Histogram.BOUNDS] + ["+Inf"], h.buckets):
+                cumulative += n
+                lines.append(f'undercover_command_latency_us_bucket{{command="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'undercover_command_latency_us_sum{{command="{name}"}} {h.total:.3f}')
+            lines.append(f'undercover_command_latency_us_count{{command="{name}"}} {h.count}')
+        for name, value in gauges.items():
+            lines.append(f"# TYPE undercover_{name} gauge")
+            if isinstance(value, dict):
+                for label, v in value.items():
+                    lines.append(f'undercover_{name}{{status="{label}"}} {v}')
+            else:
+                lines.append(f"undercover_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str, gauges: dict):
+        """写入指标文件（阻塞 I/O），.json 后缀写 JSON，其余写 Prometheus 文本"""
+        if path.endswith(".json"):
+            text = json.dumps(self.snapshot(gauges), ensure_ascii=False, indent=2)
+        else:
+            text = self.to_prometheus(gauges)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
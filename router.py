@@ -0,0 +1,168 @@
+import inspect
+
+
+class CommandContext:
+    """一次子指令调用的上下文
+
+    shard 为发送者所在会话的房间状态；前置条件检查通过后，
+    room_id / room / player 为解析出的房间和玩家。
+    """
+    __slots__ = ("event", "user_id", "user_name", "args", "shard", "room_id", "room", "player")
+
+    def __init__(self, event, args: list):
+        self.event = event
+        self.user_id = event.get_sender_id()
+        self.user_name = event.get_sender_name()
+        self.args = args  # 子指令之后的参数
+        self.shard = None
+        self.room_id = None
+        self.room = None
+        self.player = None
+
+    @property
+    def text(self) -> str:
+        """全部参数以空格连接，用于发言内容、投票目标等"""
+        return " ".join(self.args)
+
+    def arg(self, index: int, default: str = "") -> str:
+        return self.args[index] if len(self.args) > index else default
+
+
+class Precondition:
+    """子指令前置条件，检查失败时回复 message 对应的消息模板"""
+    message = ""
+
+    def __init__(self, message: str = None):
+        if message:
+            self.message = message
+
+    def check(self, plugin, ctx: CommandContext) -> bool:
+        raise NotImplementedError
+
+
+class InRoom(Precondition):
+    """发送者在当前会话的某个房间中，同时解析出房间和玩家"""
+    message = "not_in_room"
+
+    def check(self, plugin, ctx):
+        room_id = ctx.shard.user_rooms.get(ctx.user_id)
+        room = ctx.shard.game_rooms.get(room_id)
+        if room is None:
+            return False
+        ctx.room_id = room_id
+        ctx.room = room
+        ctx.player = room.get_player(ctx.user_id)
+        return True
+
+
+class InAnyRoom(InRoom):
+    """发送者在当前会话或其他会话的某个房间中（用于私聊查看群内房间的信息）
+
+    当前会话中没有房间时，在发送者有房间的其他会话中查找，优先选择状态为 prefer 的房间。
+    """
+
+    def __init__(self, message: str = None, prefer=None):
+        super().__init__(message)
+        self.prefer = prefer
+
+    def check(self, plugin, ctx):
+        if super().check(plugin, ctx):
+            return True
+        found = None
+        for scope in plugin.user_scopes.get(ctx.user_id, ()):
+            ctx.shard = plugin.shards[scope]
+            if super().check(plugin, ctx):
+                found = (ctx.shard, ctx.room_id, ctx.room, ctx.player)
+                if ctx.room.status is self.prefer:
+                    return True
+        if found is None:
+            return False
+        ctx.shard, ctx.room_id, ctx.room, ctx.player = found
+        return True
+
+
+class IsOwner(Precondition):
+    """发送者是房主（需在 InRoom 之后）"""
+    message = "owner_only"
+
+    def check(self, plugin, ctx):
+        return ctx.room.owner_id == ctx.user_id
+
+
+class HasStatus(Precondition):
+    """房间处于指定状态（需在 InRoom 之后）"""
+
+    def __init__(self, status, message: str):
+        super().__init__(message)
+        self.status = status
+
+    def check(self, plugin, ctx):
+        return ctx.room.status is self.status
+
+
+class IsAlive(Precondition):
+    """发送者仍存活（需在 InRoom 之后）"""
+    message = "eliminated"
+
+    def check(self, plugin, ctx):
+        return ctx.player is not None and ctx.player.is_alive
+
+
+class IsAdmin(Precondition):
+    """发送者是 AstrBot 管理员"""
+    message = "admin_only"
+
+    def check(self, plugin, ctx):
+        return ctx.event.is_admin()
+
+
+class Subcommand:
+    """子指令定义"""
+    __slots__ = ("name", "handler", "aliases", "requires", "locked", "room_arg")
+
+    def __init__(self, name, handler, aliases=(), requires=(), locked=False, room_arg=None):
+        self.name = name
+        self.handler = handler  # 未绑定的方法 handler(plugin, ctx)
+        self.aliases = tuple(aliases)
+        self.requires = tuple(requires)  # 按顺序检查的前置条件
+        self.locked = locked  # 是否在房间锁内执行
+        self.room_arg = room_arg  # 目标房间号所在的参数下标，None 表示发送者当前房间
+
+
+class CommandRouter:
+    """子指令路由表：子指令名和别名 -> Subcommand，一次字典查找完成分发"""
+
+    def __init__(self):
+        self._table = {}
+        self.commands = []  # 按注册顺序排列的子指令
+
+    def command(self, name: str, aliases=(), requires=(), locked=False, room_arg=None):
+        """注册子指令的装饰器"""
+        def decorator(func):
+            self.register(Subcommand(name, func, aliases, requires, locked, room_arg))
+            return func
+        return decorator
+
+    def register(self, spec: Subcommand):
+        for key in (spec.name,) + spec.aliases:
+            key = key.lower()
+            if key in self._table:
+                raise ValueError(f"子指令 {key} 重复注册")
+            self._table[key] = spec
+        self.commands.append(spec)
+
+    def resolve(self, name: str):
+        return self._table.get(name.lower())
+
+    async def dispatch(self, plugin, spec: Subcommand, ctx: CommandContext):
+        """检查前置条件后执行处理函数，处理函数可以是异步生成器或协程"""
+        for condition in spec.requires:
+            if not condition.check(plugin, ctx):
+                yield ctx.event.plain_result(plugin.t(condition.message))
+                return
+        result = spec.handler(plugin, ctx)
+        if inspect.isawaitable(result):
+            await result
+            return
+        async for r in result:
+            yield r
@@ -0,0 +1,100 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from astrbot.api import logger
+
+
+class DeadlineScheduler:
+    """共享定时器
+
+    所有截止时间放在一个最小堆里，由单个 asyncio 任务等待最早的一个，
+    不会为每个房间各开一个 sleep 任务。重新调度或取消时旧堆项不立即删除，
+    弹出时与 _entries 比对序号后丢弃（惰性删除），调度和取消都是 O(log n)。
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []  # (截止时间, 序号, key)
+        self._entries = {}  # key: (截止时间, 序号, 回调)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self._running = set()  # 正在执行的回调任务，防止被垃圾回收
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # 置位标志并唤醒，避免 wait_for 在唤醒与取消同时发生时吞掉取消
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+
+    def schedule(self, key, delay: float, callback):
+        """在 delay 秒后调用异步回调 callback()，同一 key 的旧定时器会被替换"""
+        deadline = self._clock() + max(delay, 0)
+        seq = next(self._seq)
+        self._entries[key] = (deadline, seq, callback)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            # 新定时器成为最早的一个，唤醒等待中的任务重新计算等待时间
+            self._wakeup.set()
+
+    def cancel(self, key):
+        self._entries.pop(key, None)
+
+    def deadline(self, key):
+        """key 对应定时器的截止时间，不存在时返回 None"""
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def _discard_stale(self):
+        while self._heap:
+            deadline, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while not self._stopping:
+            self._discard_stale()
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            timeout = self._heap[0][0] - self._clock()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, key = heapq.heappop(self._heap)
+            _, _, callback = self._entries.pop(key)
+            task = asyncio.create_task(self._invoke(key, callback))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _invoke(self, key, callback):
+        try:
+            await callback()
+        except Exception as e:
+            logger.error(f"定时任务 {key} 执行失败：{e}")
@@ -0,0 +1,226 @@
+import math
+import os
+import zlib
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时只做词语对自身的检查，不做近重复检索
+    np = None
+
+
+def normalize_word(word: str) -> str:
+    return "".join(word.split()).casefold()
+
+
+def word_features(word: str) -> Counter:
+    """词语的字符 n-gram 特征：单字 + 带首尾标记的相邻两字"""
+    word = normalize_word(word)
+    padded = f"^{word}$"
+    features = Counter(word)
+    features.update(padded[i:i + 2] for i in range(len(padded) - 1))
+    return features
+
+
+def cosine(a: Counter, b: Counter) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(n * b[k] for k, n in a.items() if k in b)
+    if not dot:
+        return 0.0
+    return dot / math.sqrt(sum(n * n for n in a.values()) * sum(n * n for n in b.values()))
+
+
+class SimilarityIndex:
+    """词语对入库前的相似度检查
+
+    - 词语对自身：两个词语的字符 n-gram 余弦相似度过高（几乎是同一个词）时拒绝；
+      若提供了词向量表（word_vectors.npz，含 words 和 vectors 两个数组），
+      两个词都在表中且语义相似度过低时也拒绝
+    - 与已有词语对：每个词语按特征哈希成 DIM 维的单位向量，全部词语对的向量存放在
+      一个 (2, 容量, DIM) 的 float32 矩阵中（第一、第二个词语各占一个连续的块，
+      每组词语对 2 * DIM * 4 = 512 字节）。新词语对与整个词库逐词比较，
+      两个词语分别对应（顺序不限）时取两者中较低的相似度作为词语对的相似度，
+      因此只共用一个词语的词语对（如 篮球/足球 与 篮球/排球）不会被判为近重复。
+      四次矩阵向量乘法即可比较整个词库，10 万组词语对时为毫秒级
+    矩阵的行与 WordPairStore 的下标一一对应，只应在词语对成功入库后按入库顺序追加。
+    矩阵预留 GROWTH 比例的空余行，追加满后按同一比例扩容，避免整块复制频繁发生或内存翻倍。
+    除 available、__len__ 外的方法都是阻塞的计算，应在线程中调用，并由调用方串行化写入。
+    """
+
+    DIM = 64  # 字符 n-gram 特征很稀疏，64 维的哈希碰撞对判定几乎没有影响
+    CHUNK = 512  # 批量检查时每次参与矩阵乘法的词语对数
+    BUILD_CHUNK = 8192  # 重建时每次哈希的词语对数，限制临时列表的内存峰值
+    GROWTH = 0.25  # 预留 / 扩容的空余行比例
+    MIN_SPARE = 1024  # 至少预留的空余行数
+
+    def __init__(self, max_similarity: float = 0.8, min_similarity: float = 0.2,
+                 near_duplicate: float = 0.75, vectors_path: str = "word_vectors.npz"):
+        self.max_similarity = max_similarity
+        self.min_similarity = min_similarity
+        self.near_duplicate = near_duplicate
+        self.vectors_path = vectors_path
+        self._matrix = None  # (2, 容量, DIM) 的 float32 矩阵，每块前 _size 行有效
+        self._size = 0
+        self._vocab = None  # 词语: 词向量表中的行号
+        self._vectors = None  # 归一化后的词向量表
+
+    @property
+    def available(self) -> bool:
+        """是否可以做近重复检索（需要 numpy）"""
+        return np is not None
+
+    def __len__(self):
+        return self._size
+
+    def load_vectors(self):
+        """读取可选的词向量表（阻塞 I/O），文件不存在时跳过"""
+        if np is None or not self.vectors_path or not os.path.exists(self.vectors_path):
+            return False
+        with np.load(self.vectors_path, allow_pickle=False) as data:
+            words, vectors = data["words"], data["vectors"].astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._vectors = vectors / np.maximum(norms, 1e-12)
+        self._vocab = {normalize_word(str(word)): i for i, word in enumerate(words)}
+        return True
+
+    def rebuild(self, pairs):
+        """按词库顺序重建向量矩阵（大词库下较慢，应在线程中调用）"""
+        if np is None:
+            return
+        pairs = list(pairs)
+        matrix = np.zeros((2, self._capacity_for(len(pairs)), self.DIM), np.float32)
+        for start in range(0, len(pairs), self.BUILD_CHUNK):
+            chunk = pairs[start:start + self.BUILD_CHUNK]
+            matrix[:, start:start + len(chunk)] = self._pair_vectors(chunk)
+        self._matrix, self._size = matrix, len(pairs)
+
+    def _capacity_for(self, size: int) -> int:
+        return size + max(int(size * self.GROWTH), self.MIN_SPARE)
+
+    def _hash_features(self, features: Counter, rows: list, cols: list, values: list, row: int):
+        """将特征带符号地哈希到 DIM 维，符号位抵消碰撞带来的偏差"""
+        norm = math.sqrt(sum(n * n for n in features.values()))
+        for feature, n in features.items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            rows.append(row)
+            cols.append(h % self.DIM)
+            values.append(n / norm if h & 0x80000000 else -n / norm)
+
+    def _pair_vectors(self, pairs) -> "np.ndarray":
+        """词语对的向量，形状为 (2, 词语对数, DIM)，每个词语各自归一化"""
+        n = len(pairs)
+        rows, cols, values = [], [], []
+        for i, (word1, word2) in enumerate(pairs):
+            self._hash_features(word_features(word1), rows, cols, values, i)
+            self._hash_features(word_features(word2), rows, cols, values, n + i)
+        matrix = np.zeros((2 * n, self.DIM), np.float32)
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(values, np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.maximum(norms, 1e-12)).reshape(2, n, self.DIM)
+
+    @staticmethod
+    def _pair_scores(vectors, others) -> "np.ndarray":
+        """两组词语对两两之间的相似度矩阵：逐词对应取较低者，两种对应顺序取较高者"""
+        first, second = vectors
+        aligned = np.minimum(first @ others[0].T, second @ others[1].T)
+        crossed = np.minimum(first @ others[1].T, second @ others[0].T)
+        return np.maximum(aligned, crossed)
+
+    def _append(self, vectors):
+        n = vectors.shape[1]
+        if self._matrix is None:
+            self._matrix = np.zeros((2, self._capacity_for(n), self.DIM), np.float32)
+        elif self._size + n > self._matrix.shape[1]:
+            grown = np.zeros((2, self._capacity_for(self._size + n), self.DIM), np.float32)
+            grown[:, :self._size] = self._matrix[:, :self._size]
+            self._matrix = grown
+        # 先写入新行再增加 _size，并发读取时看到的有效行总是完整的
+        self._matrix[:, self._size:self._size + n] = vectors
+        self._size += n
+
+    def add(self, word1: str, word2: str):
+        """登记已入库的词语对"""
+        if np is not None:
+            self._append(self._pair_vectors([(word1, word2)]))
+
+    def check_pair(self, word1: str, word2: str):
+        """检查词语对自身，不合格时返回 (原因, 相似度)，否则返回 None"""
+        if normalize_word(word1) == normalize_word(word2):
+            return "identical", 1.0
+        score = cosine(word_features(word1), word_features(word2))
+        if score >= self.max_similarity:
+            return "too_similar", score
+        if self._vocab is not None:
+            i, j = self._vocab.get(normalize_word(word1)), self._vocab.get(normalize_word(word2))
+            if i is not None and j is not None:
+                score = float(self._vectors[i] @ self._vectors[j])
+                if score < self.min_similarity:
+                    return "too_different", score
+        return None
+
+    def nearest(self, word1: str, word2: str, threshold: float = 0.0):
+        """在已有词语对中查找相似度不低于 threshold 的最接近的一个，返回 (下标, 相似度)，没有时返回 None
+
+        先用第一个词语与全部词语做两次矩阵向量乘法，词语对的相似度不会超过其中任一侧的结果，
+        只对达到阈值的少数词语对再比较第二个词语。
+        """
+        if np is None or not self._size:
+            return None
+        matrix = self._matrix[:, :self._size]
+        first, second = self._pair_vectors([(word1, word2)])[:, 0]
+        to_first = matrix[0] @ first
+        to_second = matrix[1] @ first
+        rows = np.flatnonzero(np.maximum(to_first, to_second) >= threshold)
+        if not len(rows):
+            return None
+        aligned = np.minimum(to_first[rows], matrix[1, rows] @ second)
+        crossed = np.minimum(to_second[rows], matrix[0, rows] @ second)
+        scores = np.maximum(aligned, crossed)
+        best = int(scores.argmax())
+        if scores[best] < threshold:
+            return None
+        return int(rows[best]), float(scores[best])
+
+    def check(self, word1: str, word2: str):
+        """完整检查，不合格时返回 (原因, 相似度, 相近词语对下标或 None)，否则返回 None"""
+        verdict = self.check_pair(word1, word2)
+        if verdict is not None:
+            return verdict + (None,)
+        found = self.nearest(word1, word2, self.near_duplicate)
+        if found is not None:
+            return "near_duplicate", found[1], found[0]
+        return None
+
+    def vet(self, pairs: list):
+        """批量检查待导入的词语对（应在线程中调用），不修改索引
+
+        返回 (通过检查的下标列表, 它们的向量或 None，形状为 (2, 通过数, DIM))。与已有词库按 CHUNK 分块做矩阵乘法，
+        同一批内互相接近的词语对只保留先出现的一个。
+        """
+        candidates = [i for i, (word1, word2) in enumerate(pairs) if self.check_pair(word1, word2) is None]
+        if np is None or not candidates:
+            return candidates, None
+        existing = self._matrix[:, :self._size] if self._size else None
+        accepted, accepted_vectors = [], []
+        for start in range(0, len(candidates), self.CHUNK):
+            chunk = candidates[start:start + self.CHUNK]
+            vectors = self._pair_vectors([pairs[i] for i in chunk])
+            keep = np.ones(len(chunk), bool)
+            if existing is not None:
+                keep &= self._pair_scores(vectors, existing).max(axis=1) < self.near_duplicate
+            for previous in accepted_vectors:
+                if previous.shape[1]:
+                    keep &= self._pair_scores(vectors, previous).max(axis=1) < self.near_duplicate
+            within = self._pair_scores(vectors, vectors)
+            for k in range(len(chunk)):
+                if keep[k] and k + 1 < len(chunk):
+                    keep[k + 1:] &= within[k, k + 1:] < self.near_duplicate
+            accepted.extend(i for i, kept in zip(chunk, keep) if kept)
+            accepted_vectors.append(vectors[:, keep])
+        return accepted, np.concatenate(accepted_vectors, axis=1)
+
+    def extend(self, vectors):
+        """登记 vet 返回的向量（对应的词语对须已按顺序入库）"""
+        if np is not None and vectors is not None and vectors.shape[1]:
+            self._append(vectors)
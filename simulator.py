@@ -0,0 +1,721 @@
+"""谁是卧底无界面模拟器与基准测试
+
+不依赖运行中的 AstrBot 会话，用伪造的消息事件直接驱动 UndercoverPlugin：
+- run_script() 按脚本逐条执行指令，返回完整对话记录
+- play_random_game() 以固定种子随机进行一局完整游戏
+- benchmark() 在给定并发房间数下统计指令吞吐、处理延迟分位数和每房间内存
+- stress() 在多个房间中并发发出大量交错的发言和投票指令，每批之后检查对局不变量
+- benchmark_layout_memory() 对比 Player / GameRoom 使用 __slots__ 与实例 __dict__ 时的内存占用
+- benchmark_persistence() 以相同的对局对比 memory 与 sqlite 状态后端下每条指令的耗时
+- benchmark_dispatch() 对比旧版 if/elif 分支与路由表查找子指令的耗时，以及单条指令的完整分发开销
+- benchmark_rendering() 统计大房间下名单和消息模板的渲染耗时
+- check_recent_pairs() 检查抽词时不会抽到最近用过的词语对
+- benchmark_similarity() 检查近重复判定规则后，统计大词库下添加词语对时相似度检查的耗时
+- benchmark_game_log() 统计大量对局同时写入对局日志的吞吐和回放读取耗时
+
+插件和模拟器都使用种子驱动的随机数，相同种子下对局完全一致。
+在 AstrBot 根目录下运行：
+
+    python -m data.plugins.astrbot_plugin_undercover.simulator --rooms 10 1000 100000
+    python -m data.plugins.astrbot_plugin_undercover.simulator --stress 50 --commands 20000
+    python -m data.plugins.astrbot_plugin_undercover.simulator --layout-memory 10000
+    python -m data.plugins.astrbot_plugin_undercover.simulator --persistence 1000
+    python -m data.plugins.astrbot_plugin_undercover.simulator --dispatch
+    python -m data.plugins.astrbot_plugin_undercover.simulator --render 30
+    python -m data.plugins.astrbot_plugin_undercover.simulator --similarity 100000
+    python -m data.plugins.astrbot_plugin_undercover.simulator --check
+    python -m data.plugins.astrbot_plugin_undercover.simulator --log-games 10000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from array import array
+from types import SimpleNamespace
+
+from .game_log import EVENT_END, EVENT_SPEECH, EVENT_START, EVENT_VOTE, GameLog, make_game_id
+from .main import GameRoom, Player, Role, RoomStatus, UndercoverPlugin, router
+from .similarity import SimilarityIndex
+from .state_store import create_state_store
+from .stats_store import create_stats_store
+from .templates import get_templates
+from .word_store import RecentRing, WordPairFile, WordPairStore
+
+# 模拟时使用的插件配置：内存存储、不限时、不限速
+SIM_CONFIG = {
+    "state_backend": "memory",
+    "speech_timeout": 0,
+    "vote_timeout": 0,
+    "broadcast_rate": 1e9,
+    "broadcast_burst": 10 ** 9,
+    "broadcast_queue_size": 0,
+    "metrics_interval": 0,
+}
+
+
+# 未指定会话时的默认会话（同一个群聊）
+DEFAULT_SESSION = "sim:GroupMessage:default"
+
+
+class FakeEvent:
+    """伪造的 AstrMessageEvent，只实现插件用到的接口"""
+
+    def __init__(self, user_id: str, user_name: str, message_str: str, session: str, admin: bool = False):
+        self.message_str = message_str
+        self.message_obj = SimpleNamespace(message=[])
+        self.unified_msg_origin = session
+        self.user_id = user_id
+        self.user_name = user_name
+        self.admin = admin
+
+    def get_sender_id(self) -> str:
+        return self.user_id
+
+    def get_sender_name(self) -> str:
+        return self.user_name
+
+    def get_platform_name(self) -> str:
+        return self.unified_msg_origin.split(":", 1)[0]
+
+    def is_admin(self) -> bool:
+        return self.admin
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+
+class FakeContext:
+    """伪造的 Context，记录插件主动推送的消息"""
+
+    def __init__(self, record: bool = False):
+        self.record = record  # 是否保存消息内容，基准测试时只计数
+        self.sent = []  # (会话, 消息链)
+        self.sent_count = 0
+
+    async def send_message(self, session, chain):
+        self.sent_count += 1
+        if self.record:
+            self.sent.append((session, chain))
+        return True
+
+
+class Simulator:
+    """驱动单个插件实例的模拟器"""
+
+    def __init__(self, seed: int = 0, config: dict = None, record: bool = False):
+        self.rng = random.Random(seed)  # 模拟玩家的决策
+        self.context = FakeContext(record)
+        plugin_config = dict(SIM_CONFIG)
+        plugin_config.update(config or {})
+        plugin_config["random_seed"] = seed
+        self.plugin = UndercoverPlugin(self.context, plugin_config)
+        # 词语库放在临时目录，不读写插件目录下的文件
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.plugin.word_pairs_io = WordPairFile(os.path.join(self._tmpdir.name, "word_pairs.json"))
+        if self.plugin.game_log is not None:
+            self.plugin.game_log = GameLog(os.path.join(self._tmpdir.name, "logs"))
+        if plugin_config["state_backend"] == "sqlite":
+            self.plugin.state_store = create_state_store("sqlite", os.path.join(self._tmpdir.name, "state.db"))
+            self.plugin.stats_store = create_stats_store("sqlite", os.path.join(self._tmpdir.name, "stats.db"))
+        self.latencies = array("q")  # 每条指令的处理耗时（纳秒）
+
+    async def start(self):
+        await self.plugin.initialize()
+        await self.plugin.ensure_word_pairs()
+
+    async def stop(self):
+        await self.plugin.terminate()
+        self._tmpdir.cleanup()
+
+    async def send(self, user_id: str, command: str, session: str = None, admin: bool = False) -> list:
+        """以 user_id 的身份发送 /undercover <command>，返回插件的回复"""
+        event = FakeEvent(user_id, user_id, f"undercover {command}", session or DEFAULT_SESSION, admin)
+        replies = []
+        start = time.perf_counter_ns()
+        async for result in self.plugin.undercover(event):
+            replies.append(result)
+        self.latencies.append(time.perf_counter_ns() - start)
+        # 让出事件循环，广播发送任务和定时器得以运行
+        await asyncio.sleep(0)
+        return replies
+
+    async def run_script(self, lines) -> list:
+        """执行脚本，每行形如 "用户: 子指令 参数"，# 开头的行为注释
+
+        返回 (用户, 指令, 回复列表) 的列表。
+        """
+        transcript = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            user_id, _, command = line.partition(":")
+            user_id, command = user_id.strip(), command.strip()
+            transcript.append((user_id, command, await self.send(user_id, command)))
+        return transcript
+
+    async def open_room(self, prefix: str, num_players: int):
+        """创建房间并让 num_players 名玩家加入、开始游戏，返回房间"""
+        session = f"sim:GroupMessage:{prefix}"
+        owner = f"{prefix}-0"
+        await self.send(owner, "create", session)
+        shard = self.plugin.shards[session]
+        room_id = shard.user_rooms[owner]
+        for i in range(1, num_players):
+            await self.send(f"{prefix}-{i}", f"join {room_id}", session)
+        await self.send(owner, "start", session)
+        return shard.game_rooms[room_id]
+
+    async def step(self, game_room) -> bool:
+        """替房间内的玩家执行下一步操作，房间已结束时返回 False"""
+        shard = self.plugin.shards.get(game_room.scope)
+        if shard is None or shard.game_rooms.get(game_room.room_id) is not game_room:
+            return False
+        if game_room.status is not RoomStatus.PLAYING:
+            return False
+        if game_room.current_speaker_index < len(game_room.speech_order):
+            speaker = game_room.speech_order[game_room.current_speaker_index]
+            await self.send(speaker.user_id, f"say 第{game_room.round}轮的描述", speaker.session)
+            return True
+        alive = game_room.alive_players()
+        voter = next(p for p in alive if p.user_id not in game_room.votes)
+        target = self.rng.choice([p for p in alive if p is not voter])
+        await self.send(voter.user_id, f"vote #{target.seat}", voter.session)
+        return True
+
+    async def play_random_game(self, num_players: int = 6, prefix: str = "p", max_steps: int = 1000):
+        """随机进行一局完整游戏，返回结束后的房间"""
+        game_room = await self.open_room(prefix, num_players)
+        for _ in range(max_steps):
+            if not await self.step(game_room):
+                break
+        return game_room
+
+    def latency_percentile(self, q: float) -> float:
+        """指令处理延迟的分位数（微秒）"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] / 1000
+
+
+async def benchmark(num_rooms: int, num_players: int = 4, seed: int = 0) -> dict:
+    """同时开 num_rooms 个房间并轮流推进到全部结束
+
+    内存按开房前后 tracemalloc 的差值计算（开房阶段开启追踪），
+    吞吐和延迟只统计关闭追踪后的对局阶段。
+    """
+    sim = Simulator(seed)
+    await sim.start()
+    try:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        rooms = [await sim.open_room(f"b{i}", num_players) for i in range(num_rooms)]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        room_bytes = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        del before, after
+
+        sim.latencies = array("q")
+        start = time.perf_counter()
+        active = rooms
+        while active:
+            active = [room for room in active if await sim.step(room)]
+        elapsed = time.perf_counter() - start
+        commands = len(sim.latencies)
+        return {
+            "rooms": num_rooms,
+            "commands": commands,
+            "seconds": elapsed,
+            "commands_per_sec": commands / elapsed if elapsed else 0.0,
+            "p50_us": sim.latency_percentile(0.50),
+            "p99_us": sim.latency_percentile(0.99),
+            "bytes_per_room": room_bytes / num_rooms,
+        }
+    finally:
+        await sim.stop()
+
+
+def check_invariants(game_room: GameRoom):
+    """检查房间的对局不变量，违反时抛出 AssertionError"""
+    key = game_room.key
+    assert game_room.alive_ids == {p.user_id for p in game_room.players if p.is_alive}, f"{key} 存活名单不一致"
+    assert sum(game_room.vote_counts.values()) == len(game_room.votes), f"{key} 得票总数与投票数不一致"
+    # 结束时最后一轮的选票保留原样，其中可能有刚被票出局的玩家
+    if game_room.status is RoomStatus.PLAYING:
+        assert all(voter_id in game_room.alive_ids for voter_id in game_room.votes), f"{key} 有非存活玩家投票"
+    assert 0 <= game_room.current_speaker_index <= len(game_room.speech_order), f"{key} 发言位置越界"
+
+
+async def stress(num_rooms: int = 50, num_commands: int = 20000, num_players: int = 6, batch: int = 8,
+                 seed: int = 0) -> dict:
+    """并发压力测试：num_rooms 个房间同时进行，直到累计发出 num_commands 条指令
+
+    每批为每个房间生成 batch 条指令：发言阶段一半由当前发言者发出（同一人的并发发言），
+    其余由随机玩家（包括已出局的）发出；投票阶段由随机玩家投给随机座位。
+    一批中所有房间的指令用 asyncio.gather 并发执行，之后逐个房间检查对局不变量，
+    已结束的房间换成新房间。
+    """
+    sim = Simulator(seed)
+    await sim.start()
+    opened = 0
+
+    async def open_next():
+        nonlocal opened
+        opened += 1
+        return await sim.open_room(f"s{opened}", num_players)
+
+    try:
+        rooms = [await open_next() for _ in range(num_rooms)]
+        sent = finished = checks = 0
+        start = time.perf_counter()
+        while sent < num_commands:
+            commands = []
+            for room in rooms:
+                speaking = room.current_speaker_index < len(room.speech_order)
+                for _ in range(batch):
+                    if speaking and sim.rng.random() < 0.5:
+                        player = room.speech_order[room.current_speaker_index]
+                    else:
+                        player = sim.rng.choice(room.players)
+                    if speaking:
+                        command = f"say 第{room.round}轮的描述"
+                    else:
+                        command = f"vote #{sim.rng.choice(room.players).seat}"
+                    commands.append(sim.send(player.user_id, command, player.session))
+            sent += len(commands)
+            await asyncio.gather(*commands)
+            for i, room in enumerate(rooms):
+                check_invariants(room)
+                checks += 1
+                if room.status is not RoomStatus.PLAYING:
+                    finished += 1
+                    rooms[i] = await open_next()
+        elapsed = time.perf_counter() - start
+        return {
+            "rooms": num_rooms,
+            "commands": sent,
+            "games_finished": finished,
+            "invariant_checks": checks,
+            "commands_per_sec": sent / elapsed if elapsed else 0.0,
+        }
+    finally:
+        await sim.stop()
+
+
+async def benchmark_persistence(num_rooms: int = 1000, num_players: int = 4, seed: int = 0,
+                                flush_every: int = 500) -> dict:
+    """相同种子的同一组对局分别在 memory 和 sqlite 状态后端下运行，测量持久化的每条指令开销
+
+    对局日志关闭，两次运行的指令序列完全相同。sqlite 后端每 flush_every 条指令批量写入一次
+    （相当于插件按 state_flush_interval 定时写入），写入耗时计入总时间。
+    *_us_per_command 为含开房在内每条指令的平均耗时，overhead_us 为两者之差，
+    flush_ms 为 sqlite 后端全部批量写入的耗时。
+    """
+    results = {}
+    for backend in ("memory", "sqlite"):
+        sim = Simulator(seed, config={"state_backend": backend, "game_log_dir": ""})
+        await sim.start()
+        try:
+            flush_ns = flushed = 0
+            start = time.perf_counter()
+            active = [await sim.open_room(f"b{i}", num_players) for i in range(num_rooms)]
+            while active:
+                active = [room for room in active if await sim.step(room)]
+                if len(sim.latencies) - flushed >= flush_every:
+                    t0 = time.perf_counter_ns()
+                    await sim.plugin.flush_state()
+                    flush_ns += time.perf_counter_ns() - t0
+                    flushed = len(sim.latencies)
+            t0 = time.perf_counter_ns()
+            await sim.plugin.flush_state()
+            flush_ns += time.perf_counter_ns() - t0
+            elapsed = time.perf_counter() - start
+            results[backend] = (len(sim.latencies), elapsed, flush_ns, sim.latency_percentile(0.5))
+        finally:
+            await sim.stop()
+    commands = results["memory"][0]
+    assert results["sqlite"][0] == commands, "两种后端下的指令序列不一致"
+    memory_us = results["memory"][1] / commands * 1e6
+    sqlite_us = results["sqlite"][1] / results["sqlite"][0] * 1e6
+    return {
+        "rooms": num_rooms,
+        "commands": commands,
+        "memory_us_per_command": memory_us,
+        "sqlite_us_per_command": sqlite_us,
+        "overhead_us": sqlite_us - memory_us,
+        "memory_p50_us": results["memory"][3],
+        "sqlite_p50_us": results["sqlite"][3],
+        "flush_ms": results["sqlite"][2] / 1e6,
+    }
+
+
+# 1.1.2 版 undercover() 中 if/elif 分支的子指令顺序
+LEGACY_COMMANDS = ("create", "join", "start", "leave", "say", "vote", "end", "add", "word", "list")
+
+
+def _legacy_lookup(message_str: str):
+    """1.1.2 版的分发方式：切分两次，再依次比较各分支"""
+    message_str = message_str.strip()
+    args = message_str.split()[1:] if len(message_str.split()) > 1 else []
+    sub_cmd = args[0].lower()
+    for i, name in enumerate(LEGACY_COMMANDS):
+        if sub_cmd == name:
+            return i
+    return None
+
+
+def _table_lookup(message_str: str):
+    args = message_str.split()[1:]
+    return router.resolve(args[0])
+
+
+async def benchmark_dispatch(iterations: int = 20000) -> dict:
+    """子指令分发的微基准
+
+    lookup：对 1.1.2 版的每个子指令，分别用旧版方式和路由表（切分一次 + 一次字典查找）
+    找到处理函数的平均耗时（纳秒），last 为旧版最后一个分支（list）的耗时；
+    dispatch：不在房间中的玩家经 undercover() 入口发送需要房间的指令，
+    只经过解析、查表、前置条件检查和回复，得到单条指令分发开销的 p50（微秒）。
+    """
+    messages = [f"undercover {name} 参数" for name in LEGACY_COMMANDS]
+
+    def measure(lookup, message_list) -> float:
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            for message in message_list:
+                lookup(message)
+        return (time.perf_counter_ns() - start) / iterations / len(message_list)
+
+    results = {
+        "legacy_lookup_ns": measure(_legacy_lookup, messages),
+        "table_lookup_ns": measure(_table_lookup, messages),
+        "legacy_last_ns": measure(_legacy_lookup, messages[-1:]),
+        "table_last_ns": measure(_table_lookup, messages[-1:]),
+    }
+    sim = Simulator(0)
+    await sim.start()
+    try:
+        for command in ("say 你好", "vote #1", "leave", "end", "start"):
+            sim.latencies = array("q")
+            for _ in range(iterations // 10):
+                await sim.send("outsider", command)
+            results[f"dispatch_{command.split()[0]}_us"] = sim.latency_percentile(0.5)
+    finally:
+        await sim.stop()
+    return results
+
+
+def _dict_layout(cls):
+    """去掉 __slots__ 的同名类：方法完全相同，实例属性存放在 __dict__ 中（旧版布局）"""
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name not in cls.__slots__ and name != "__slots__"}
+    return type(cls.__name__, cls.__bases__, namespace)
+
+
+def benchmark_layout_memory(num_rooms: int = 10000, num_players: int = 6) -> dict:
+    """对比 __slots__ 布局与实例 __dict__ 布局下 Player / GameRoom 的内存占用
+
+    两种布局执行完全相同的构造代码（身份和状态都是枚举，只差实例属性的存放方式），
+    用 tracemalloc 统计创建 num_rooms 个各含 num_players 名已分配身份的玩家的房间时新分配的内存；
+    玩家 ID 等字符串预先创建，不计入。
+    """
+    users = [[f"r{r}u{i}" for i in range(num_players)] for r in range(num_rooms)]
+
+    def build(player_cls, room_cls) -> list:
+        rooms = []
+        for r, user_ids in enumerate(users):
+            game_room = room_cls(str(r), user_ids[0], user_ids[0], seed=r, scope=DEFAULT_SESSION)
+            for i, user_id in enumerate(user_ids):
+                player = player_cls(user_id, user_id, DEFAULT_SESSION)
+                player.role = Role.UNDERCOVER if i == 0 else Role.CITIZEN
+                player.word = "梨" if i == 0 else "苹果"
+                game_room.add_player(player)
+            game_room.status = RoomStatus.PLAYING
+            rooms.append(game_room)
+        return rooms
+
+    def measure(player_cls, room_cls) -> int:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        rooms = build(player_cls, room_cls)
+        used = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        del rooms
+        return used
+
+    def measure_players(player_cls) -> int:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        players = [player_cls(user_id, user_id, DEFAULT_SESSION) for user_ids in users for user_id in user_ids]
+        used = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        del players
+        return used
+
+    dict_player, dict_room = _dict_layout(Player), _dict_layout(GameRoom)
+    slots_bytes, dict_bytes = measure(Player, GameRoom), measure(dict_player, dict_room)
+    total_players = num_rooms * num_players
+    return {
+        "rooms": num_rooms,
+        "players": total_players,
+        "dict_bytes_per_room": dict_bytes / num_rooms,
+        "slots_bytes_per_room": slots_bytes / num_rooms,
+        "dict_bytes_per_player": measure_players(dict_player) / total_players,
+        "slots_bytes_per_player": measure_players(Player) / total_players,
+        "saved_percent": (1 - slots_bytes / dict_bytes) * 100 if dict_bytes else 0.0,
+    }
+
+
+def benchmark_rendering(num_players: int = 30, iterations: int = 10000, language: str = "zh") -> dict:
+    """测量 num_players 人房间的消息渲染耗时（微秒/次）
+
+    roster_cold 每次清空缓存后重新渲染名单，roster_cached 为缓存命中；
+    game_started / game_over 为完整消息（含名单或全员身份公示）的渲染耗时。
+    """
+    t = get_templates(language)
+    game_room = GameRoom("1", "u0", "玩家0", seed=0)
+    for i in range(num_players):
+        player = Player(f"u{i}", f"玩家{i}")
+        player.role = Role.UNDERCOVER if i % 5 == 0 else Role.CITIZEN
+        player.word = "苹果" if player.role is Role.CITIZEN else "梨"
+        game_room.add_player(player)
+
+    def measure(func) -> float:
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter_ns() - start) / iterations / 1000
+
+    def roster_cold():
+        game_room.roster_cache = None
+        return t.roster(game_room)
+
+    def game_over():
+        item = t.messages["reveal_item"]
+        reveal = "\n".join(item.format(name=p.user_name, role=t.role_name(p.role), word=p.word)
+                           for p in game_room.players)
+        return t("game_over", winner=t.role_name(Role.CITIZEN), reveal=reveal)
+
+    return {
+        "players": num_players,
+        "help": measure(lambda: t.help_text),
+        "roster_cold": measure(roster_cold),
+        "roster_cached": measure(lambda: t.roster(game_room)),
+        "game_started": measure(lambda: t("game_started", roster=t.roster(game_room))),
+        "game_over": measure(game_over),
+    }
+
+
+def check_similarity_rules():
+    """近重复判定的基本规则：只共用一个词语的词语对应当通过，两个词语都相同（顺序不限）时拒绝"""
+    index = SimilarityIndex()
+    existing = [("电脑", "手机"), ("篮球", "足球"), ("红色", "蓝色")]
+    index.rebuild(existing)
+    for word1, word2 in [("手机", "电话"), ("篮球", "排球"), ("红色", "绿色")]:
+        verdict = index.check(word1, word2)
+        assert verdict is None, f"{word1}/{word2} 被误判：{verdict}"
+    if index.available:
+        for word1, word2 in [("足球", "篮球"), ("电脑", "手机")]:
+            verdict = index.check(word1, word2)
+            assert verdict is not None and verdict[0] == "near_duplicate", f"{word1}/{word2} 未判为近重复"
+        accepted, _ = index.vet([("手机", "电话"), ("电话", "手机"), ("篮球", "排球")])
+        assert accepted == [0, 2], f"批量检查结果有误：{accepted}"
+
+
+def check_recent_pairs(draws: int = 300, seed: int = 0):
+    """不重复出题的基本规则：每次抽取都不会落在最近 min(容量, 候选数 - 1) 次抽到的词语对中"""
+    rng = random.Random(seed)
+    default = WordPairStore(UndercoverPlugin.get_default_word_pairs(None))
+    tagged = WordPairStore(default.to_list())
+    for i in range(40):
+        tagged.add(f"甲{i}", f"乙{i}", ("食物" if i < 6 else "其他", "", 1.0 + i % 3))
+    cases = [(default, None, 20), (default, None, 10), (default, None, 1), (tagged, None, 20), (tagged, "食物", 20)]
+    for store, category, capacity in cases:
+        ring, history = RecentRing(capacity), []
+        candidates = sum(1 for i in range(len(store)) if category is None or store.tag(i)[0] == category)
+        window = min(capacity, candidates - 1)
+        for _ in range(draws):
+            index = store.sample(rng, category, recent=ring)
+            if category is not None:
+                assert store.tag(index)[0] == category, f"抽到了分类以外的词语对 {index}"
+            recent = [i for i in history if category is None or store.tag(i)[0] == category]
+            assert index not in recent[max(0, len(recent) - window):], \
+                f"容量 {capacity}、分类 {category} 时最近 {window} 次内重复抽到 {index}"
+            ring.push(index)
+            history.append(index)
+
+
+def benchmark_similarity(num_pairs: int = 100000, queries: int = 200, seed: int = 0) -> dict:
+    """在 num_pairs 组随机词语对的词库上测量相似度检查耗时
+
+    词语由常用汉字随机组成，build_s 为构建向量矩阵的耗时（秒），build_peak_mb 为构建期间的内存峰值，
+    matrix_mb 为矩阵（含预留行）占用的内存，check_ms 为单次添加时完整检查（含近重复检索）的平均耗时，
+    add_ms 为逐条登记 queries 组词语对的平均耗时（毫秒，预留行足够时不会整块复制）。
+    """
+    check_similarity_rules()
+    rng = random.Random(seed)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+    def word() -> str:
+        return "".join(rng.choice(chars) for _ in range(rng.randint(2, 4)))
+
+    pairs = [(word(), word()) for _ in range(num_pairs)]
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    index.rebuild(pairs)
+    build = time.perf_counter() - start
+    # 追踪内存会拖慢构建，另外重建一次测峰值
+    tracemalloc.start()
+    index.rebuild(pairs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    candidates = [(word(), word()) for _ in range(queries)]
+    start = time.perf_counter_ns()
+    for word1, word2 in candidates:
+        index.check(word1, word2)
+    check = (time.perf_counter_ns() - start) / queries / 1e6
+    start = time.perf_counter_ns()
+    for word1, word2 in candidates:
+        index.add(word1, word2)
+    add = (time.perf_counter_ns() - start) / queries / 1e6
+    matrix = index._matrix.nbytes / 2 ** 20 if index._matrix is not None else 0.0
+    return {"pairs": num_pairs, "vectorized": index.available, "build_s": build, "build_peak_mb": peak / 2 ** 20,
+            "matrix_mb": matrix, "check_ms": check, "add_ms": add}
+
+
+async def benchmark_game_log(num_games: int = 10000, events_per_game: int = 40, flush_every: int = 5000) -> dict:
+    """num_games 局同时进行、事件交错写入对局日志
+
+    每登记 flush_every 条事件在线程中写出一次（与插件按间隔批量写出相同）。
+    append_us 为单条事件登记到缓冲区的耗时（事件循环上的开销），events_per_sec 为
+    含写出在内的整体吞吐，replay_ms 为从分段文件中读出一局全部事件的耗时。
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log = GameLog(tmpdir)
+        now = time.time()
+        # 全部对局在同一秒内开局，只靠种子区分
+        rng = random.Random(0)
+        game_ids = [make_game_id(now, rng.getrandbits(64)) for _ in range(num_games)]
+        assert len(set(game_ids)) == num_games, "对局编号重复"
+        speech = {"round": 1, "name": "玩家", "text": "这是一段长度适中的描述"}
+        vote = {"round": 1, "voter": "玩家甲", "target": "玩家乙"}
+        append_ns = 0
+        start = time.perf_counter()
+        for game_id in game_ids:
+            log.append(game_id, EVENT_START, {"room": "1", "words": ["苹果", "梨"], "players": []}, now)
+        pending = 0
+        for step in range(events_per_game - 2):
+            kind, payload = (EVENT_SPEECH, speech) if step % 2 else (EVENT_VOTE, vote)
+            for game_id in game_ids:
+                t0 = time.perf_counter_ns()
+                log.append(game_id, kind, payload, now)
+                append_ns += time.perf_counter_ns() - t0
+                pending += 1
+                if pending >= flush_every:
+                    await log.flush()
+                    pending = 0
+        for game_id in game_ids:
+            log.append(game_id, EVENT_END, {"winner": "citizen"}, now)
+        await log.flush()
+        elapsed = time.perf_counter() - start
+        total = log.events_logged
+        size = sum(os.path.getsize(os.path.join(tmpdir, name)) for name in os.listdir(tmpdir))
+        t0 = time.perf_counter()
+        events = log.read_game(game_ids[num_games // 2])
+        replay = time.perf_counter() - t0
+    return {
+        "games": num_games,
+        "events": total,
+        "events_per_sec": total / elapsed if elapsed else 0.0,
+        "append_us": append_ns / max(1, num_games * (events_per_game - 2)) / 1000,
+        "bytes_per_event": size / total,
+        "replay_ms": replay * 1000,
+        "replayed_events": len(events),
+    }
+
+
+def format_report(results: list) -> str:
+    lines = [f"{'房间数':>8} {'指令数':>10} {'指令/秒':>10} {'p50(us)':>9} {'p99(us)':>9} {'内存/房间(B)':>12}"]
+    for r in results:
+        lines.append(f"{r['rooms']:>10} {r['commands']:>12} {r['commands_per_sec']:>12.0f} "
+                     f"{r['p50_us']:>10.1f} {r['p99_us']:>10.1f} {r['bytes_per_room']:>14.0f}")
+    return "\n".join(lines)
+
+
+async def _main(args):
+    if args.script:
+        sim = Simulator(args.seed, record=True)
+        await sim.start()
+        try:
+            with open(args.script, "r", encoding="utf-8") as f:
+                transcript = await sim.run_script(f)
+        finally:
+            await sim.stop()
+        for user_id, command, replies in transcript:
+            print(f"{user_id}> {command}")
+            for reply in replies:
+                print(f"  {reply}")
+        return
+    if args.check:
+        check_recent_pairs(seed=args.seed)
+        check_similarity_rules()
+        print("ok")
+        return
+    if args.stress:
+        for name, value in (await stress(args.stress, args.commands, args.players, seed=args.seed)).items():
+            print(f"{name:>16}: {value:.3f}" if isinstance(value, float) else f"{name:>16}: {value}")
+        return
+    if args.log_games:
+        for name, value in (await benchmark_game_log(args.log_games)).items():
+            print(f"{name:>16}: {value:.3f}" if isinstance(value, float) else f"{name:>16}: {value}")
+        return
+    if args.similarity:
+        for name, value in benchmark_similarity(args.similarity, seed=args.seed).items():
+            print(f"{name:>10}: {value:.3f}" if isinstance(value, float) else f"{name:>10}: {value}")
+        return
+    if args.dispatch:
+        for name, value in (await benchmark_dispatch()).items():
+            print(f"{name:>18}: {value:.3f}")
+        return
+    if args.persistence:
+        for name, value in (await benchmark_persistence(args.persistence, args.players, args.seed)).items():
+            print(f"{name:>22}: {value:.3f}" if isinstance(value, float) else f"{name:>22}: {value}")
+        return
+    if args.layout_memory:
+        for name, value in benchmark_layout_memory(args.layout_memory, args.players).items():
+            print(f"{name:>22}: {value:.1f}" if isinstance(value, float) else f"{name:>22}: {value}")
+        return
+    if args.render:
+        for name, value in benchmark_rendering(args.render).items():
+            print(f"{name:>14}: {value:.3f}" if isinstance(value, float) else f"{name:>14}: {value}")
+        return
+    results = []
+    for num_rooms in args.rooms:
+        results.append(await benchmark(num_rooms, args.players, args.seed))
+    print(format_report(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="谁是卧底插件模拟器与基准测试")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[10, 1000, 100000], help="并发房间数")
+    parser.add_argument("--players", type=int, default=4, help="每个房间的玩家数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--script", help="按脚本执行指令并打印对话记录，而不是运行基准测试")
+    parser.add_argument("--check", action="store_true", help="检查抽词不重复和近重复判定等规则，不通过时报错退出")
+    parser.add_argument("--stress", type=int, metavar="ROOMS", help="在指定数量的房间中并发发送指令并检查对局不变量")
+    parser.add_argument("--commands", type=int, default=20000, help="压力测试发出的指令总数")
+    parser.add_argument("--dispatch", action="store_true", help="测量子指令查找和分发的耗时")
+    parser.add_argument("--persistence", type=int, metavar="ROOMS", help="对比指定房间数下两种状态后端的每条指令耗时")
+    parser.add_argument("--layout-memory", type=int, metavar="ROOMS", help="对比指定房间数下两种对象布局的内存占用")
+    parser.add_argument("--render", type=int, metavar="PLAYERS", help="测量指定人数房间的消息渲染耗时（微秒/次）")
+    parser.add_argument("--similarity", type=int, metavar="PAIRS", help="测量指定词库规模下的相似度检查耗时")
+    parser.add_argument("--log-games", type=int, metavar="GAMES", help="测量指定局数同时进行时对局日志的写入吞吐")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
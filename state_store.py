@@ -0,0 +1,129 @@
+import asyncio
+import json
+import sqlite3
+
+from astrbot.api import logger
+
+
+class StateStore:
+    """房间状态存储接口
+
+    插件在每次状态变化后调用 stage_room / stage_delete / stage_meta 登记变更，
+    再由 flush() 批量写入。load() 在插件初始化时恢复全部房间。
+    """
+
+    async def open(self):
+        pass
+
+    async def load(self):
+        """返回 (房间数据列表, 元数据字典)"""
+        return [], {}
+
+    def stage_room(self, room_id: str, data: dict):
+        pass
+
+    def stage_delete(self, room_id: str):
+        pass
+
+    def stage_meta(self, key: str, value):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """仅内存存储（不持久化），重启后状态丢失"""
+
+
+class SqliteStateStore(StateStore):
+    """SQLite 存储
+
+    使用 WAL 模式；登记的变更在内存中合并（同一房间只保留最后一次快照），
+    flush() 时在线程中以单个事务批量写入。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._rooms = {}  # room_id: 房间数据，None 表示删除
+        self._meta = {}
+        self._lock = asyncio.Lock()  # 串行化对连接的访问
+
+    async def open(self):
+        self._conn = await asyncio.to_thread(self._connect)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS rooms (room_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.commit()
+        return conn
+
+    async def load(self):
+        async with self._lock:
+            return await asyncio.to_thread(self._load)
+
+    def _load(self):
+        rooms = []
+        for room_id, data in self._conn.execute("SELECT room_id, data FROM rooms"):
+            try:
+                rooms.append(json.loads(data))
+            except ValueError:
+                logger.warning(f"房间 {room_id} 的存档已损坏，已跳过")
+        meta = {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM meta")}
+        return rooms, meta
+
+    def stage_room(self, room_id: str, data: dict):
+        self._rooms[room_id] = data
+
+    def stage_delete(self, room_id: str):
+        self._rooms[room_id] = None
+
+    def stage_meta(self, key: str, value):
+        self._meta[key] = value
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._rooms or self._meta)
+
+    async def flush(self):
+        if self._conn is None or not self.has_pending:
+            return
+        rooms, self._rooms = self._rooms, {}
+        meta, self._meta = self._meta, {}
+        upserts = [(room_id, json.dumps(data, ensure_ascii=False)) for room_id, data in rooms.items() if data is not None]
+        deletes = [(room_id,) for room_id, data in rooms.items() if data is None]
+        meta_rows = [(key, json.dumps(value)) for key, value in meta.items()]
+        async with self._lock:
+            await asyncio.to_thread(self._write, upserts, deletes, meta_rows)
+
+    def _write(self, upserts, deletes, meta_rows):
+        with self._conn:
+            if upserts:
+                self._conn.executemany("INSERT OR REPLACE INTO rooms (room_id, data) VALUES (?, ?)", upserts)
+            if deletes:
+                self._conn.executemany("DELETE FROM rooms WHERE room_id = ?", deletes)
+            if meta_rows:
+                self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta_rows)
+
+    async def close(self):
+        await self.flush()
+        if self._conn is not None:
+            async with self._lock:
+                await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+
+def create_state_store(backend: str, path: str) -> StateStore:
+    """按配置创建存储后端"""
+    if backend == "sqlite":
+        return SqliteStateStore(path)
+    if backend != "memory":
+        logger.warning(f"未知的状态存储后端 {backend}，改用内存存储")
+    return MemoryStateStore()
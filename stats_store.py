@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import sqlite3
+
+from astrbot.api import logger
+
+
+class PlayerRecord:
+    """玩家在某个会话中的累计战绩"""
+    __slots__ = ("user_id", "name", "games", "wins", "undercover_games", "undercover_wins")
+
+    def __init__(self, user_id: str, name: str, games=0, wins=0, undercover_games=0, undercover_wins=0):
+        self.user_id = user_id
+        self.name = name
+        self.games = games
+        self.wins = wins
+        self.undercover_games = undercover_games
+        self.undercover_wins = undercover_wins
+
+    @property
+    def citizen_games(self) -> int:
+        return self.games - self.undercover_games
+
+    @property
+    def citizen_wins(self) -> int:
+        return self.wins - self.undercover_wins
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+    @property
+    def sort_key(self) -> tuple:
+        """排行顺序：胜场多者在前，胜场相同时局数少（胜率高）者在前"""
+        return (-self.wins, self.games, self.user_id)
+
+
+class Leaderboard:
+    """单个会话的排行榜
+
+    战绩按 user_id 存放在字典中，另以 sort_key 维护一个有序列表：
+    每局结束后先二分删除旧键、更新战绩、再二分插入新键，
+    查询名次为一次二分查找，前 N 名为列表切片，都不需要全表排序。
+    """
+
+    def __init__(self):
+        self._records = {}  # user_id: PlayerRecord
+        self._names = {}  # 昵称: user_id（同名时为最近一次对局的玩家）
+        self._sorted = []  # 全部玩家的 sort_key，升序
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, user_id: str):
+        return self._records.get(user_id)
+
+    def find(self, query: str):
+        """按 user_id 或昵称查找战绩"""
+        record = self._records.get(query)
+        if record is None and query in self._names:
+            record = self._records.get(self._names[query])
+        return record
+
+    def load(self, record: PlayerRecord):
+        """载入存档中的战绩（启动时调用）"""
+        self._records[record.user_id] = record
+        self._names[record.name] = record.user_id
+        bisect.insort(self._sorted, record.sort_key)
+
+    def apply(self, user_id: str, name: str, won: bool, undercover: bool) -> PlayerRecord:
+        """计入一局的结果"""
+        record = self._records.get(user_id)
+        if record is None:
+            record = self._records[user_id] = PlayerRecord(user_id, name)
+        else:
+            del self._sorted[bisect.bisect_left(self._sorted, record.sort_key)]
+            if self._names.get(record.name) == user_id:
+                del self._names[record.name]
+        record.name = name
+        record.games += 1
+        record.wins += won
+        record.undercover_games += undercover
+        record.undercover_wins += won and undercover
+        self._names[name] = user_id
+        bisect.insort(self._sorted, record.sort_key)
+        return record
+
+    def rank(self, record: PlayerRecord) -> int:
+        """名次（从 1 开始）"""
+        return bisect.bisect_left(self._sorted, record.sort_key) + 1
+
+    def top(self, n: int) -> list:
+        return [self._records[key[2]] for key in self._sorted[:n]]
+
+
+class StatsStore:
+    """战绩存储接口
+
+    每局结束后调用 stage() 登记各玩家的增量，flush() 批量写入。
+    load() 在插件初始化时返回全部 (会话, PlayerRecord)。
+    """
+
+    async def open(self):
+        pass
+
+    async def load(self) -> list:
+        return []
+
+    def stage(self, scope: str, user_id: str, name: str, won: bool, undercover: bool):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryStatsStore(StatsStore):
+    """仅内存存储（不持久化），战绩只保存在排行榜中"""
+
+
+class SqliteStatsStore(StatsStore):
+    """SQLite 存储
+
+    登记的增量在内存中按 (会话, user_id) 合并，flush() 时在线程中以单个事务
+    执行 INSERT ... ON CONFLICT DO UPDATE，累加到已有的行上。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._pending = {}  # (会话, user_id): [昵称, 局数, 胜场, 卧底局数, 卧底胜场]
+        self._lock = asyncio.Lock()  # 串行化对连接的访问
+
+    async def open(self):
+        self._conn = await asyncio.to_thread(self._connect)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS player_stats ("
+            "scope TEXT NOT NULL, user_id TEXT NOT NULL, name TEXT NOT NULL, "
+            "games INTEGER NOT NULL, wins INTEGER NOT NULL, "
+            "undercover_games INTEGER NOT NULL, undercover_wins INTEGER NOT NULL, "
+            "PRIMARY KEY (scope, user_id))"
+        )
+        conn.commit()
+        return conn
+
+    async def load(self) -> list:
+        async with self._lock:
+            rows = await asyncio.to_thread(lambda: self._conn.execute(
+                "SELECT scope, user_id, name, games, wins, undercover_games, undercover_wins FROM player_stats"
+            ).fetchall())
+        return [(row[0], PlayerRecord(*row[1:])) for row in rows]
+
+    def stage(self, scope: str, user_id: str, name: str, won: bool, undercover: bool):
+        delta = self._pending.get((scope, user_id))
+        if delta is None:
+            delta = self._pending[(scope, user_id)] = [name, 0, 0, 0, 0]
+        delta[0] = name
+        delta[1] += 1
+        delta[2] += won
+        delta[3] += undercover
+        delta[4] += won and undercover
+
+    async def flush(self):
+        if self._conn is None or not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [(scope, user_id, *delta) for (scope, user_id), delta in pending.items()]
+        async with self._lock:
+            await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO player_stats (scope, user_id, name, games, wins, undercover_games, undercover_wins) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (scope, user_id) DO UPDATE SET "
+                "name = excluded.name, games = games + excluded.games, wins = wins + excluded.wins, "
+                "undercover_games = undercover_games + excluded.undercover_games, "
+                "undercover_wins = undercover_wins + excluded.undercover_wins",
+                rows,
+            )
+
+    async def close(self):
+        await self.flush()
+        if self._conn is not None:
+            async with self._lock:
+                await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+
+def create_stats_store(backend: str, path: str) -> StatsStore:
+    """按配置创建战绩存储后端（与房间状态使用同一种后端）"""
+    if backend == "sqlite":
+        return SqliteStatsStore(path)
+    if backend != "memory":
+        logger.warning(f"未知的战绩存储后端 {backend}，改用内存存储")
+    return MemoryStatsStore()
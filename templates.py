@@ -0,0 +1,76 @@
+import json
+import os
+
+from astrbot.api import logger
+
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+DEFAULT_LANGUAGE = "zh"
+
+_loaded = {}  # 语言: Templates，每种语言只加载一次
+
+
+class Templates:
+    """消息模板
+
+    从 locales/<语言>.json 加载，缺失的键回退到默认语言。帮助文本等静态消息
+    在加载时拼好，之后每次返回同一个字符串；房间名单渲染后缓存在房间上，
+    只在玩家加入、离开或被淘汰时失效。
+    """
+
+    def __init__(self, language: str, messages: dict):
+        self.language = language
+        self.messages = messages
+        self.help_text = "\n".join(messages["help"])
+
+    def __call__(self, key: str, **kwargs) -> str:
+        template = self.messages[key]
+        return template.format(**kwargs) if kwargs else template
+
+    def role_name(self, role) -> str:
+        return self.messages["role_" + role.value]
+
+    def status_name(self, status) -> str:
+        return self.messages["status_" + status.value]
+
+    def join_names(self, names) -> str:
+        return self.messages["name_sep"].join(names)
+
+    def roster(self, game_room) -> str:
+        """存活玩家名单（座位号 + 昵称，按座位排序）
+
+        结果缓存在 game_room.roster_cache，一个插件实例只使用一种语言，缓存无需区分语言。
+        """
+        roster = game_room.roster_cache
+        if roster is None:
+            item = self.messages["roster_item"]
+            roster = self.messages["list_sep"].join(
+                item.format(seat=p.seat, name=p.user_name) for p in game_room.alive_players())
+            game_room.roster_cache = roster
+        return roster
+
+
+def _read_bundle(language: str) -> dict:
+    with open(os.path.join(LOCALE_DIR, f"{language}.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_templates(language: str = DEFAULT_LANGUAGE) -> Templates:
+    """获取某种语言的消息模板，不存在的语言回退到默认语言"""
+    templates = _loaded.get(language)
+    if templates is not None:
+        return templates
+    if language == DEFAULT_LANGUAGE:
+        messages = _read_bundle(language)
+    else:
+        messages = dict(get_templates(DEFAULT_LANGUAGE).messages)
+        try:
+            messages.update(_read_bundle(language))
+        except (OSError, ValueError) as e:
+            logger.warning(f"加载语言包 {language} 失败，使用默认语言：{e}")
+            return get_templates(DEFAULT_LANGUAGE)
+    templates = _loaded[language] = Templates(language, messages)
+    return templates
+
+
+# 默认语言在导入时加载，帮助文本随之拼好
+get_templates(DEFAULT_LANGUAGE)
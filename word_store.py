@@ -0,0 +1,517 @@
+import bisect
+import csv
+import json
+import mmap
+import os
+import random
+import struct
+from array import array
+
+# 未打标签的词语对共用的标签：(分类, 难度, 权重)
+DEFAULT_TAG = ("", "", 1.0)
+
+
+def parse_entry(entry):
+    """解析一条词语对记录，返回 (词语1, 词语2, 标签)，格式错误时返回 None
+
+    支持两种格式（word_pairs.json 和导入文件通用）：
+    - ["词语1", "词语2"]：无标签
+    - {"pair": ["词语1", "词语2"], "category": "食物", "difficulty": "easy", "weight": 2}
+    """
+    if isinstance(entry, dict):
+        pair = entry.get("pair")
+        tag = make_tag(entry.get("category"), entry.get("difficulty"), entry.get("weight"))
+    else:
+        pair, tag = entry, DEFAULT_TAG
+    if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+        return None
+    word1, word2 = pair
+    if not isinstance(word1, str) or not isinstance(word2, str) or not word1 or not word2:
+        return None
+    if tag is None:
+        return None
+    return word1, word2, tag
+
+
+def make_tag(category=None, difficulty=None, weight=None):
+    """规范化标签，权重非正数或无法解析时返回 None"""
+    category = str(category).strip() if category else ""
+    difficulty = str(difficulty).strip() if difficulty else ""
+    try:
+        weight = float(weight) if weight not in (None, "") else 1.0
+    except (TypeError, ValueError):
+        return None
+    if not weight > 0:
+        return None
+    tag = (category, difficulty, weight)
+    return DEFAULT_TAG if tag == DEFAULT_TAG else tag
+
+
+def read_pairs_file(path: str) -> list:
+    """读取待导入的 CSV 或 JSON 文件，返回原始记录列表（阻塞 I/O）
+
+    JSON 为记录列表，格式同 word_pairs.json。CSV 每行为
+    词语1,词语2[,分类[,难度[,权重]]]，首行为 word1 表头时跳过。
+    """
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError("JSON 文件应为词语对列表")
+        return data
+    entries = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        try:
+            for row in csv.reader(f):
+                row = [cell.strip() for cell in row]
+                if not any(row) or row[0].lower() == "word1":
+                    continue
+                category, difficulty, weight = (row[2:] + ["", "", ""])[:3]
+                entries.append({"pair": row[:2], "category": category, "difficulty": difficulty, "weight": weight})
+        except csv.Error as e:
+            raise ValueError(f"CSV 格式错误：{e}") from e
+    return entries
+
+
+class AliasTable:
+    """Walker/Vose 别名表：O(n) 构建，之后每次按权重抽样 O(1)"""
+
+    __slots__ = ("_prob", "_alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self._prob = array("d", [1.0]) * n
+        self._alias = array("l", range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 剩余项的概率因浮点误差略偏离 1，视为 1
+
+    def __len__(self):
+        return len(self._prob)
+
+    def sample(self, rng=random) -> int:
+        i = rng.randrange(len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+class WeightedSampler:
+    """按权重从一组词语对下标中抽样，支持 O(1) 追加
+
+    构建时对全部候选建立别名表（权重全部为 1 时直接均匀抽样，不建表）。
+    之后追加的候选：只要权重始终全部为 1，就直接扩大均匀抽样的范围；
+    否则放入尾部的累积权重数组，抽样时先按总权重决定落在别名表还是尾部，
+    尾部用二分查找。追加从不重建别名表，词语库重新加载后才合并为一张表。
+    """
+
+    __slots__ = ("indices", "uniform", "_table", "_base", "_base_weight", "_tail")
+
+    def __init__(self, indices, weights):
+        self.indices = indices  # 候选下标（range 或列表）
+        self.uniform = all(w == 1.0 for w in weights)  # 权重是否全部为 1
+        self._table = None if self.uniform else AliasTable(weights)
+        self._base = len(indices)  # 由别名表（或均匀抽样）覆盖的前缀长度
+        self._base_weight = float(self._base) if self.uniform else float(sum(weights))
+        self._tail = array("d")  # 前缀之后各候选的累积权重
+
+    def __len__(self):
+        return len(self.indices)
+
+    def append(self, index: int, weight: float):
+        if isinstance(self.indices, range):
+            self.indices = range(self.indices.start, index + 1)  # 不限条件时候选恰为全部下标
+        else:
+            self.indices.append(index)
+        if self.uniform and weight == 1.0:
+            self._base += 1
+            self._base_weight += 1.0
+        else:
+            self.uniform = False
+            self._tail.append((self._tail[-1] if self._tail else 0.0) + weight)
+
+    def sample(self, rng=random) -> int:
+        """返回 indices 中的位置"""
+        if self._tail:
+            r = rng.random() * (self._base_weight + self._tail[-1])
+            if r >= self._base_weight:
+                pos = bisect.bisect_right(self._tail, r - self._base_weight)
+                return self._base + min(pos, len(self._tail) - 1)
+        if self._table is None:
+            return rng.randrange(self._base)
+        return self._table.sample(rng)
+
+
+class RecentRing:
+    """最近抽到的词语对（固定容量的环形缓冲 + 计数字典）
+
+    记录和查询都是 O(1)，容量满后最早的记录被覆盖，用于同一群内避免重复出题。
+    """
+
+    __slots__ = ("capacity", "_ring", "_pos", "_counts")
+
+    def __init__(self, capacity: int, items=()):
+        self.capacity = max(0, int(capacity))
+        self._ring = [None] * self.capacity
+        self._pos = 0
+        self._counts = {}  # 下标: 在环中出现的次数
+        for item in items:
+            self.push(item)
+
+    def __contains__(self, index) -> bool:
+        return index in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        """遍历环中的不同下标"""
+        return iter(self._counts)
+
+    def newest(self, limit: int, predicate=None) -> set:
+        """从新到旧取至多 limit 个不同的下标，predicate 不为空时只取满足条件的"""
+        found = set()
+        pos = self._pos
+        for _ in range(self.capacity):
+            if len(found) >= limit:
+                break
+            pos = (pos - 1) % self.capacity
+            item = self._ring[pos]
+            if item is None:
+                break  # 环尚未写满，更早的位置都是空的
+            if predicate is None or predicate(item):
+                found.add(item)
+        return found
+
+    def push(self, index: int):
+        if not self.capacity:
+            return
+        old = self._ring[self._pos]
+        if old is not None:
+            if self._counts[old] == 1:
+                del self._counts[old]
+            else:
+                self._counts[old] -= 1
+        self._ring[self._pos] = index
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self._pos = (self._pos + 1) % self.capacity
+
+    def to_list(self) -> list:
+        """按从旧到新的顺序导出，用于持久化"""
+        items = self._ring[self._pos:] + self._ring[:self._pos]
+        return [item for item in items if item is not None]
+
+
+class WordPairStore:
+    """词语对存储
+
+    在列表之外维护两个索引：
+    - 顺序无关的哈希索引，用于 O(1) 判重（[A, B] 与 [B, A] 视为同一对）
+    - 词语到词语对下标的倒排索引，用于按词语查询
+    每个词语对带有 (分类, 难度, 权重) 标签。按标签筛选后的候选集合和抽样器
+    在首次抽取时构建并缓存，之后按权重抽样 O(1)；添加词语对时只向筛选条件
+    与其标签相符的抽样器追加，不重建。
+    索引可以延迟构建，随机抽取不依赖索引。
+    """
+
+    def __init__(self, word_pairs=None):
+        self._pairs = []  # (词语1, 词语2) 元组列表，保持添加顺序
+        self._tags = []  # 与 _pairs 对应的 (分类, 难度, 权重)
+        self._index = {}  # 规范化键 -> 在 _pairs 中的下标，None 表示尚未构建
+        self._word_index = {}  # 词语 -> 包含该词语的词语对下标集合
+        self._samplers = {}  # (分类, 难度): WeightedSampler，None 表示不限
+        if word_pairs:
+            self.extend(word_pairs)
+
+    @classmethod
+    def from_trusted(cls, word_pairs: list, tags: list = None) -> "WordPairStore":
+        """直接接管已去重、格式正确的词语对列表，索引延迟到首次需要时构建"""
+        store = cls()
+        store._pairs = word_pairs
+        store._tags = tags if tags is not None else [DEFAULT_TAG] * len(word_pairs)
+        store._index = None
+        store._word_index = None
+        return store
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    def build_index(self):
+        """构建判重索引和倒排索引（大词库下较慢，可在线程中调用）"""
+        if self._index is not None:
+            return
+        index = {}
+        word_index = {}
+        for idx, (word1, word2) in enumerate(self._pairs):
+            index.setdefault(self.pair_key(word1, word2), idx)
+            word_index.setdefault(word1, set()).add(idx)
+            word_index.setdefault(word2, set()).add(idx)
+        self._word_index = word_index
+        self._index = index
+
+    @staticmethod
+    def pair_key(word1: str, word2: str) -> tuple:
+        """词语对的规范化键，与顺序无关"""
+        return (word1, word2) if word1 <= word2 else (word2, word1)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def __iter__(self):
+        return iter(self._pairs)
+
+    def __getitem__(self, index: int) -> tuple:
+        return self._pairs[index]
+
+    def __contains__(self, pair) -> bool:
+        word1, word2 = pair
+        self.build_index()
+        return self.pair_key(word1, word2) in self._index
+
+    def add(self, word1: str, word2: str, tag: tuple = DEFAULT_TAG) -> bool:
+        """添加词语对，已存在时返回 False"""
+        self.build_index()
+        key = self.pair_key(word1, word2)
+        if key in self._index:
+            return False
+        idx = len(self._pairs)
+        self._pairs.append((word1, word2))
+        self._tags.append(tag)
+        self._index[key] = idx
+        self._word_index.setdefault(word1, set()).add(idx)
+        self._word_index.setdefault(word2, set()).add(idx)
+        for (category, difficulty), sampler in self._samplers.items():
+            if (category is None or category == tag[0]) and (difficulty is None or difficulty == tag[1]):
+                sampler.append(idx, tag[2])
+        return True
+
+    def extend(self, word_pairs) -> int:
+        """批量添加词语对记录，跳过格式错误和重复的条目，返回实际添加数量"""
+        added = 0
+        for entry in word_pairs:
+            parsed = parse_entry(entry)
+            if parsed is not None and self.add(*parsed):
+                added += 1
+        return added
+
+    def tag(self, index: int) -> tuple:
+        return self._tags[index]
+
+    def categories(self) -> list:
+        return sorted({tag[0] for tag in self._tags if tag[0]})
+
+    def difficulties(self) -> list:
+        return sorted({tag[1] for tag in self._tags if tag[1]})
+
+    def prepare_sampler(self, category=None, difficulty=None):
+        """预先构建抽样器（大词库下较慢，可在词语库发布前于线程中调用）"""
+        self._sampler(category, difficulty)
+
+    def _sampler(self, category=None, difficulty=None):
+        key = (category, difficulty)
+        sampler = self._samplers.get(key)
+        if sampler is None:
+            if category is None and difficulty is None:
+                indices = range(len(self._pairs))
+            else:
+                indices = [i for i, (c, d, _) in enumerate(self._tags)
+                           if (category is None or c == category) and (difficulty is None or d == difficulty)]
+            sampler = self._samplers[key] = WeightedSampler(indices, [self._tags[i][2] for i in indices])
+        return sampler
+
+    def sample(self, rng=random, category=None, difficulty=None, recent: RecentRing = None,
+               max_tries: int = 8) -> int:
+        """按权重抽取一个符合分类和难度的词语对，返回其下标
+
+        recent 为最近抽到的词语对记录，其中符合筛选条件的最新 min(容量, 候选数 - 1) 个
+        一定不会被抽中：候选不够时只放开最早的记录，至少留下一个可抽的候选。
+        先按权重抽样，抽中排除的词语对时重抽，max_tries 次都落在排除集合中时
+        改为在未排除的候选中按权重抽取。没有符合条件的词语对时抛出 LookupError。
+        """
+        sampler = self._sampler(category, difficulty)
+        indices = sampler.indices
+        if not indices:
+            raise LookupError("没有符合条件的词语对")
+        excluded = ()
+        if recent is not None and len(indices) > 1:
+            if category is None and difficulty is None:
+                excluded = recent.newest(len(indices) - 1)
+            else:
+                tags = self._tags
+                excluded = recent.newest(len(indices) - 1, lambda i: i < len(tags) and (
+                    category is None or tags[i][0] == category) and (difficulty is None or tags[i][1] == difficulty))
+        for _ in range(max_tries if excluded else 1):
+            index = indices[sampler.sample(rng)]
+            if index not in excluded:
+                return index
+        # 排除的词语对占了候选的大部分，直接在其余候选中抽取
+        allowed = [i for i in indices if i not in excluded]
+        if sampler.uniform:
+            return rng.choice(allowed)
+        return rng.choices(allowed, [self._tags[i][2] for i in allowed])[0]
+
+    def choice(self, rng=random) -> tuple:
+        """随机抽取一个词语对"""
+        if not self._pairs:
+            raise IndexError("词语库为空")
+        return self._pairs[self.sample(rng)]
+
+    def pairs_with(self, word: str) -> list:
+        """查询包含指定词语的所有词语对"""
+        self.build_index()
+        return [self._pairs[i] for i in sorted(self._word_index.get(word, ()))]
+
+    def entry(self, index: int):
+        """导出一条记录，无标签时为 [词语1, 词语2]，与旧版 word_pairs.json 兼容"""
+        pair, tag = self._pairs[index], self._tags[index]
+        if tag is DEFAULT_TAG:
+            return list(pair)
+        entry = {"pair": list(pair)}
+        if tag[0]:
+            entry["category"] = tag[0]
+        if tag[1]:
+            entry["difficulty"] = tag[1]
+        if tag[2] != 1.0:
+            entry["weight"] = tag[2]
+        return entry
+
+    def to_list(self) -> list:
+        """导出为 word_pairs.json 使用的列表格式"""
+        return [self.entry(i) for i in range(len(self._pairs))]
+
+
+class WordPairFile:
+    """词语库文件
+
+    由 JSON 快照（word_pairs.json，记录格式见 parse_entry）和追加写的 JSONL 日志组成。
+    新增词语对只追加到日志，日志累积到一定条数后再压缩进快照。
+    快照通过临时文件 + os.replace 原子替换，写到一半崩溃不会截断原文件。
+
+    每次写快照时同时生成一份紧凑的二进制副本（word_pairs.bin），
+    启动时若二进制副本不旧于 JSON 快照，则通过 mmap 直接读取，跳过 JSON 解析。
+    """
+
+    BINARY_MAGIC = b"UCWP"
+    BINARY_VERSION = 2
+    # 魔数、版本、词语对数量、正文字节数；正文为每对的 词语1、词语2、分类、难度
+    # 以 \0 连接后的 UTF-8，其后紧跟 数量 个 float64 权重
+    BINARY_HEADER = struct.Struct("<4sBII")
+
+    def __init__(self, snapshot_path: str, journal_path: str = None, binary_path: str = None):
+        base = os.path.splitext(snapshot_path)[0]
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or base + ".journal.jsonl"
+        self.binary_path = binary_path or base + ".bin"
+        self.journal_size = 0  # 日志中尚未压缩的条目数
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path)
+
+    def load(self, default=None) -> WordPairStore:
+        """读取快照并回放日志（阻塞 I/O，应在线程中调用）
+
+        快照不存在时用 default 生成一份。
+        """
+        store = self._load_binary()
+        if store is None:
+            store = WordPairStore()
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    store.extend(json.load(f))
+            except (OSError, ValueError):
+                if default:
+                    store.extend(default)
+                if not self.exists():
+                    self.write_snapshot(store.to_list())
+            else:
+                self._write_binary(store.to_list())
+        self._replay_journal(store)
+        return store
+
+    def _load_binary(self):
+        """读取二进制快照，不存在、过期或损坏时返回 None"""
+        try:
+            if os.path.getmtime(self.binary_path) < os.path.getmtime(self.snapshot_path):
+                return None
+            with open(self.binary_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    magic, version, count, size = self.BINARY_HEADER.unpack_from(mm, 0)
+                    if magic != self.BINARY_MAGIC or version != self.BINARY_VERSION:
+                        return None
+                    start = self.BINARY_HEADER.size
+                    words = mm[start:start + size].decode("utf-8").split("\0") if count else []
+                    weights = array("d", mm[start + size:start + size + count * 8])
+        except (OSError, ValueError, struct.error):
+            return None
+        if len(words) != count * 4 or len(weights) != count:
+            return None
+        pairs = list(zip(words[0::4], words[1::4]))
+        tags = [DEFAULT_TAG if tag == DEFAULT_TAG else tag
+                for tag in zip(words[2::4], words[3::4], weights)]
+        return WordPairStore.from_trusted(pairs, tags)
+
+    def _write_binary(self, word_pairs: list):
+        entries = [parse_entry(entry) for entry in word_pairs]
+        body = "\0".join(field for word1, word2, (category, difficulty, _) in entries
+                         for field in (word1, word2, category, difficulty)).encode("utf-8")
+        weights = array("d", [tag[2] for _, _, tag in entries])
+        tmp_path = self.binary_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.BINARY_HEADER.pack(self.BINARY_MAGIC, self.BINARY_VERSION, len(entries), len(body)))
+            f.write(body)
+            f.write(weights.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.binary_path)
+
+    def _replay_journal(self, store: WordPairStore):
+        self.journal_size = 0
+        if not os.path.exists(self.journal_path):
+            return
+        valid_end = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 崩溃时可能留下写了一半的最后一行
+                    break
+                valid_end += len(line)
+                try:
+                    entry = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                store.extend([entry])
+                self.journal_size += 1
+        # 截掉残缺的尾行，避免后续追加的内容与其拼接成坏行
+        if valid_end != os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_end)
+
+    def append(self, entry):
+        """追加一条词语对记录到日志（阻塞 I/O，应在线程中调用）"""
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_size += 1
+
+    def write_snapshot(self, word_pairs: list):
+        """原子写入快照及其二进制副本，并清空日志（阻塞 I/O，应在线程中调用）"""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(word_pairs, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._write_binary(word_pairs)
+        # 快照已包含日志中的全部条目；若在此之前崩溃，回放时重复条目会被去重
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journal_size = 0